@@ -1,26 +1,136 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import MutableHeaders
+from typing import Optional, List, Tuple
 import jwt
 import bcrypt
 import os
 import uuid
+import asyncio
+import base64
+import functools
+import hashlib
+import inspect
+import json
+import re
+import shutil
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+import logging
 import pymongo
-from pymongo import MongoClient
+from pymongo import ASCENDING, TEXT, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
+from motor.motor_asyncio import AsyncIOMotorClient
+from multipart.multipart import MultipartParser, parse_options_header
 import mimetypes
+import multiprocessing
+import socket
+import ssl
 import subprocess
 from pathlib import Path
+from urllib.parse import urljoin, urlsplit
 
-# Connect to MongoDB
-client = MongoClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
-db = client.test_database
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # image derivatives are skipped without Pillow
+    Image = ImageOps = None
 
-app = FastAPI()
+try:
+    import orjson
+except ImportError:  # responses fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # only gzip is offered without it
+    brotli = None
+
+# Connect to MongoDB (async driver so Mongo round trips never block the event loop)
+client = AsyncIOMotorClient(
+    os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+    maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+    maxIdleTimeMS=int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000')),
+    waitQueueTimeoutMS=int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '10000')),
+)
+db = client[os.environ.get('DB_NAME', 'test_database')]
+
+logger = logging.getLogger(__name__)
+
+# JSON responses
+# Route results are rendered to bytes in one orjson pass, datetimes included
+# (same ISO format as before), instead of jsonable_encoder followed by the
+# stdlib encoder. Values orjson doesn't know fall back to jsonable_encoder.
+def dump_json(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=jsonable_encoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dump_json(content)
+
+def render_directly(endpoint, status_code: Optional[int]):
+    """Wrap an endpoint so plain results become a FastJSONResponse before FastAPI sees them.
+
+    FastAPI runs jsonable_encoder over any non-Response result. The wrapper asks
+    for the sub-response (adding a parameter if the endpoint has none) so the
+    headers and status code endpoints set on it are carried over.
+    """
+    signature = inspect.signature(endpoint)
+    response_param = next(
+        (name for name, param in signature.parameters.items() if param.annotation is Response), None
+    )
+    injected = response_param is None
+    if injected:
+        response_param = "_sub_response"
+        signature = signature.replace(parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter(response_param, inspect.Parameter.KEYWORD_ONLY, annotation=Response),
+        ])
+
+    def finish(result, sub_response: Response):
+        if isinstance(result, Response):
+            return result
+        response = FastJSONResponse(result, status_code=sub_response.status_code or status_code or 200)
+        response.headers.raw.extend(sub_response.headers.raw)
+        return response
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            sub_response = kwargs.pop(response_param) if injected else kwargs[response_param]
+            return finish(await endpoint(*args, **kwargs), sub_response)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            sub_response = kwargs.pop(response_param) if injected else kwargs[response_param]
+            return finish(endpoint(*args, **kwargs), sub_response)
+    wrapper.__signature__ = signature
+    return wrapper
+
+class FastJSONRoute(APIRoute):
+    """Renders results with FastJSONResponse directly; routes with a response_model keep FastAPI's validation"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        response_model = kwargs.get("response_model")
+        if response_model is None or type(response_model).__name__ == "DefaultPlaceholder":
+            endpoint = render_directly(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
+
+app = FastAPI(default_response_class=FastJSONResponse)
+app.router.route_class = FastJSONRoute
 
 # CORS middleware
 app.add_middleware(
@@ -29,18 +139,364 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Response compression
+# JSON, NDJSON and text responses are compressed with brotli or gzip according
+# to Accept-Encoding once they reach COMPRESSION_MIN_SIZE bytes. Streamed bodies
+# are flushed chunk by chunk so NDJSON rows still arrive as they are produced.
+# Responses that advertise Accept-Ranges (media), partial and HEAD responses
+# pass through untouched. Compressed responses get an encoding-specific ETag
+# ("<tag>-gzip"), which etag_matches accepts back.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+COMPRESSION_THREAD_THRESHOLD = int(os.environ.get('COMPRESSION_THREAD_THRESHOLD', str(256 * 1024)))
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "image/svg+xml", "text/")
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip by the client's q-values, preferring br on a tie"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding.lower()] = q
+    available = ("br", "gzip") if brotli is not None else ("gzip",)
+    q, _, coding = max((weights.get(coding, weights.get("*", 0.0)), -i, coding) for i, coding in enumerate(available))
+    return coding if q > 0 else None
+
+class Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self.engine = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self.engine = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress a chunk and flush it, so the client can decode it without waiting for the rest"""
+        if self.encoding == "br":
+            return self.engine.process(data) + (self.engine.finish() if final else self.engine.flush())
+        return self.engine.compress(data) + self.engine.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next(
+            (value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), ""
+        )
+        encoding = negotiate_encoding(accept_encoding)
+        held_start = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal held_start, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                compressible = (
+                    200 <= message["status"] < 300 and message["status"] not in (204, 206)
+                    and "content-encoding" not in headers
+                    and "accept-ranges" not in headers
+                    and headers.get("content-type", "").startswith(COMPRESSIBLE_MEDIA_TYPES)
+                )
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                if not compressible or encoding is None:
+                    passthrough = True
+                    await send(message)
+                else:
+                    held_start = message
+                return
+            if message["type"] != "http.response.body":
+                passthrough = True  # e.g. a zero-copy send; leave the bytes alone
+                if held_start:
+                    await send(held_start)
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < COMPRESSION_MIN_SIZE:
+                    passthrough = True
+                    await send(held_start)
+                    await send(message)
+                    return
+                compressor = Compressor(encoding)
+                headers = MutableHeaders(raw=held_start["headers"])
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and etag.endswith('"'):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    if len(body) >= COMPRESSION_THREAD_THRESHOLD:
+                        body = await asyncio.to_thread(compressor.compress, body, True)
+                    else:
+                        body = compressor.compress(body, True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(held_start)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(held_start)
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, final=not more_body),
+                "more_body": more_body,
+            })
+
+        await self.app(scope, receive, compressing_send)
+
+app.add_middleware(CompressionMiddleware)
+
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 SECRET_KEY = "your-secret-key-here"
+# Roles allowed to run maintenance that rewrites indexes or stored data. They are
+# granted in the users collection; signup refuses them.
+ADMIN_ROLES = {role.strip() for role in os.environ.get('ADMIN_ROLES', 'admin').split(',') if role.strip()}
+
+# Password hashing runs on a bounded pool so bcrypt never stalls the event loop
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '32'))
+password_hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_hash_pending = 0
+
+@app.on_event("shutdown")
+async def close_password_hash_pool():
+    password_hash_pool.shutdown(wait=False, cancel_futures=True)
 
 # Create required directories
+UPLOAD_ROOT = Path("uploads")
+UPLOAD_SUBFOLDERS = {"video": "videos", "image": "images"}  # everything else goes to documents
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("uploads/videos", exist_ok=True)
 os.makedirs("uploads/images", exist_ok=True)
 os.makedirs("uploads/documents", exist_ok=True)
 
+# Index management
+# Every lookup the routes perform must be served by one of these indexes.
+REQUIRED_INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    ],
+    "classes": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+    ],
+    "subjects": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("class_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="class_id_created_at_id"),
+    ],
+    "chapters": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("subject_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="subject_id_created_at_id"),
+    ],
+    "content": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("blob_id", ASCENDING)], name="blob_id", sparse=True),
+        IndexModel([("chapter_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)], name="chapter_id_created_at_id"),
+        IndexModel(
+            [("share_root", ASCENDING), ("file_path", ASCENDING)],
+            name="share_root_file_path",
+            partialFilterExpression={"share_root": {"$exists": True}},
+        ),
+        IndexModel([("health.next_check_at", ASCENDING)], name="health_next_check_at"),
+        IndexModel([("health.status", ASCENDING), ("health.changed_at", ASCENDING)], name="health_status_changed_at"),
+    ],
+    "search_index": [
+        IndexModel(
+            [("title", TEXT), ("description", TEXT)],
+            name="search_text",
+            weights={"title": 10, "description": 2},
+            default_language=os.environ.get('SEARCH_LANGUAGE', 'english'),
+        ),
+        # Type-ahead reads matches in (title_length, rank) order straight off these
+        IndexModel(
+            [("prefixes", ASCENDING), ("title_length", ASCENDING), ("rank", ASCENDING), ("_id", ASCENDING)],
+            name="prefixes_title_length",
+        ),
+        IndexModel(
+            [("words", ASCENDING), ("title_length", ASCENDING), ("rank", ASCENDING), ("_id", ASCENDING)],
+            name="words_title_length",
+        ),
+        IndexModel([("scope", ASCENDING)], name="scope"),
+        IndexModel([("indexed_at", ASCENDING)], name="indexed_at"),
+    ],
+    "share_manifest": [
+        IndexModel([("root", ASCENDING), ("path", ASCENDING)], name="root_path_unique", unique=True),
+    ],
+    "progress": [
+        IndexModel([("user_id", ASCENDING), ("chapter_id", ASCENDING)], name="user_chapter_unique", unique=True),
+    ],
+    "progress_rollups": [
+        IndexModel(
+            [("user_id", ASCENDING), ("scope_type", ASCENDING), ("scope_id", ASCENDING)],
+            name="user_scope_unique", unique=True,
+        ),
+    ],
+    "chapter_totals": [
+        IndexModel([("scope_type", ASCENDING), ("scope_id", ASCENDING)], name="scope_unique", unique=True),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("type", ASCENDING), ("run_after", ASCENDING)], name="status_type_run_after"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+    ],
+    "upload_sessions": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at"),
+    ],
+    "chapter_ordinals": [
+        IndexModel([("chapter_id", ASCENDING)], name="chapter_id_unique", unique=True),
+        IndexModel([("ordinal", ASCENDING)], name="ordinal_unique", unique=True),
+    ],
+}
+
+# Indexes an earlier release declared that nothing uses any more
+RETIRED_INDEXES = {
+    "search_index": ["prefixes_rank"],
+}
+
+# Representative filters for each query shape the routes issue, used to
+# detect lookups that still fall back to a collection scan.
+INDEXED_QUERIES = [
+    ("users", {"email": ""}),
+    ("users", {"id": ""}),
+    ("classes", {"id": ""}),
+    ("subjects", {"id": ""}),
+    ("subjects", {"class_id": ""}),
+    ("chapters", {"id": ""}),
+    ("chapters", {"subject_id": ""}),
+    ("content", {"id": ""}),
+    ("content", {"chapter_id": ""}),
+    ("progress", {"user_id": ""}),
+    ("progress", {"user_id": "", "chapter_id": ""}),
+    ("progress_rollups", {"user_id": ""}),
+    ("content", {"blob_id": ""}),
+    ("search_index", {"prefixes": ""}),
+    ("search_index", {"words": ""}),
+    ("search_index", {"scope": ""}),
+]
+
+def index_spec_matches(existing: dict, model: IndexModel) -> bool:
+    """Check whether an existing index has the same keys and uniqueness as the declared one"""
+    document = model.document
+    if TEXT in document["key"].values():
+        # Text indexes are reported under _fts/_ftsx keys; compare their weights instead
+        return existing.get("weights") == document.get("weights")
+    return (
+        list(existing.get("key", [])) == list(document["key"].items())
+        and bool(existing.get("unique", False)) == bool(document.get("unique", False))
+    )
+
+async def check_indexes() -> dict:
+    """Compare the declared indexes with the ones that exist, without changing anything"""
+    report = {"missing": [], "mismatched": [], "unchanged": [], "retired": []}
+    for collection_name, models in REQUIRED_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        report["retired"] += [
+            f"{collection_name}.{name}" for name in RETIRED_INDEXES.get(collection_name, []) if name in existing
+        ]
+        for model in models:
+            name = model.document["name"]
+            label = f"{collection_name}.{name}"
+            if name not in existing:
+                report["missing"].append(label)
+            elif index_spec_matches(existing[name], model):
+                report["unchanged"].append(label)
+            else:
+                report["mismatched"].append(label)
+    return report
+
+async def ensure_indexes() -> dict:
+    """Idempotently create the declared indexes, migrating ones whose spec changed
+    and dropping retired ones"""
+    report = {"created": [], "migrated": [], "unchanged": [], "dropped": [], "failed": []}
+    for collection_name, models in REQUIRED_INDEXES.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        for name in RETIRED_INDEXES.get(collection_name, []):
+            if name in existing:
+                await collection.drop_index(name)
+                report["dropped"].append(f"{collection_name}.{name}")
+        for model in models:
+            name = model.document["name"]
+            label = f"{collection_name}.{name}"
+            try:
+                if name in existing:
+                    if index_spec_matches(existing[name], model):
+                        report["unchanged"].append(label)
+                        continue
+                    await collection.drop_index(name)
+                    await collection.create_indexes([model])
+                    report["migrated"].append(label)
+                else:
+                    await collection.create_indexes([model])
+                    report["created"].append(label)
+            except OperationFailure as e:
+                # Typically duplicate keys in legacy data blocking a unique index
+                logger.error("Could not build index %s: %s", label, e)
+                report["failed"].append({"index": label, "error": str(e)})
+    return report
+
+def plan_stages(plan: dict):
+    """Yield every stage name in an explain() query plan tree"""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+async def find_collection_scans() -> list:
+    """Explain each known query shape and return the ones that still use COLLSCAN"""
+    scans = []
+    for collection_name, query in INDEXED_QUERIES:
+        explain = await db.command(
+            "explain", {"find": collection_name, "filter": query}, verbosity="queryPlanner"
+        )
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in plan_stages(winning_plan):
+            scans.append({"collection": collection_name, "filter": sorted(query)})
+    return scans
+
+@app.on_event("startup")
+async def bootstrap_indexes():
+    try:
+        report = await ensure_indexes()
+        logger.info(
+            "Indexes: %d created, %d migrated, %d unchanged, %d failed",
+            len(report["created"]), len(report["migrated"]),
+            len(report["unchanged"]), len(report["failed"]),
+        )
+        for scan in await find_collection_scans():
+            logger.warning("Query on %s by %s still uses COLLSCAN", scan["collection"], scan["filter"])
+    except Exception as e:
+        # Never keep the API from starting because index bootstrap failed
+        logger.error("Index bootstrap failed: %s", e)
+
 # Pydantic models
 class UserCreate(BaseModel):
     email: str
@@ -77,6 +533,20 @@ class ProgressUpdate(BaseModel):
     chapter_id: str
     completed: bool
 
+class ProgressBatch(BaseModel):
+    updates: List[ProgressUpdate]
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    chapter_id: str
+    title: str
+    description: Optional[str] = ""
+
+class BulkCreate(BaseModel):
+    items: List[dict]
+    ordered: bool = False
+
 # Helper functions
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -85,16 +555,808 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified JWTs, each entry dropped at its token's exp"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # token -> (user_id, exp timestamp)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[str]:
+        entry = self.entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user_id, exp = entry
+        if exp <= time.time():
+            del self.entries[token]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(token)
+        self.hits += 1
+        return user_id
+
+    def put(self, token: str, user_id: str, exp: float):
+        self.entries[token] = (user_id, exp)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+token_cache = VerifiedTokenCache(int(os.environ.get('TOKEN_CACHE_SIZE', '10000')))
+
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return check_token(credentials.credentials)
+
+async def verify_media_token(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+):
+    """Like verify_token, but also accepts ?token= since <video>/<img> tags cannot send headers"""
+    if credentials:
+        return check_token(credentials.credentials)
+    if token:
+        return check_token(token)
+    raise HTTPException(status_code=403, detail="Not authenticated")
+
+async def verify_admin(user_id: str = Depends(verify_token)):
+    """Like verify_token, but only for users whose role may run admin maintenance"""
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "role": 1})
+    if not user or user.get("role") not in ADMIN_ROLES:
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user_id
+
+def check_token(token: str) -> str:
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=["HS256"])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         user_id: str = payload.get("user_id")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        # Only tokens that carry an expiry are cached, so an entry can never outlive its token
+        if "exp" in payload:
+            token_cache.put(token, user_id, float(payload["exp"]))
         return user_id
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+def _hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def _check_password(password: str, password_hash: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+async def run_password_task(func, *args):
+    """Run a bcrypt call on the hashing pool, failing fast with 503 when it is saturated"""
+    global password_hash_pending
+    if password_hash_pending >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        raise HTTPException(
+            status_code=503,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    password_hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_hash_pool, func, *args)
+    finally:
+        password_hash_pending -= 1
+
+async def hash_password(password: str) -> str:
+    return await run_password_task(_hash_password, password)
+
+async def check_password(password: str, password_hash: str) -> bool:
+    return await run_password_task(_check_password, password, password_hash)
+
+# Pagination helpers
+# List routes return every document unless ?limit= or ?cursor= is given. When a
+# page is full, the cursor for the next page is sent in the X-Next-Cursor header
+# so the response body stays a plain JSON list for existing clients.
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+CATALOG_SORT_KEYS = ("created_at", "id")
+PROGRESS_SORT_KEYS = ("chapter_id",)
+PROGRESS_HIDDEN_FIELDS = ("counted",)  # rollup bookkeeping, see reconcile_rollups
+FIELD_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+class ListParams:
+    """Query parameters shared by every list endpoint"""
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_LIMIT),
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.fields = fields
+
+    @property
+    def paginated(self) -> bool:
+        return self.limit is not None or self.cursor is not None
+
+def encode_cursor(doc: dict, sort_keys: tuple) -> str:
+    values = []
+    for key in sort_keys:
+        value = doc.get(key)
+        if isinstance(value, datetime):
+            value = {"$date": value.isoformat()}
+        values.append(value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str, sort_keys: tuple) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(sort_keys):
+            raise ValueError("cursor does not match sort keys")
+        return [
+            datetime.fromisoformat(value["$date"]) if isinstance(value, dict) else value
+            for value in values
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_filter(sort_keys: tuple, values: list) -> dict:
+    """Match documents strictly after values in (sort_keys...) ascending order"""
+    def after(key, value):
+        # Documents missing the key sort first, so everything non-null comes after them
+        return {key: {"$ne": None}} if value is None else {key: {"$gt": value}}
+
+    branches = []
+    for i, key in enumerate(sort_keys):
+        branch = {prefix: values[j] for j, prefix in enumerate(sort_keys[:i])}
+        branch.update(after(key, values[i]))
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+def build_projection(fields: Optional[str], sort_keys: tuple, hidden: tuple = ()) -> dict:
+    """Turn ?fields=a,b into a Mongo projection; sort keys are always kept for cursors
+    and ``hidden`` fields are never returned"""
+    if not fields:
+        return {"_id": 0, **{name: 0 for name in hidden}}
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    for name in names:
+        if not FIELD_NAME_RE.match(name):
+            raise HTTPException(status_code=400, detail=f"Invalid field name: {name}")
+    projection = {"_id": 0}
+    projection.update({name: 1 for name in names if name not in hidden})
+    projection.update({key: 1 for key in sort_keys})
+    return projection
+
+def list_query(query: dict, params: ListParams, sort_keys: tuple, hidden: tuple = ()) -> tuple:
+    """Resolve a list request into (filter, projection, sort, limit)"""
+    projection = build_projection(params.fields, sort_keys, hidden)
+    if not params.paginated:
+        return query, projection, None, None
+    if params.cursor:
+        query = {"$and": [query, keyset_filter(sort_keys, decode_cursor(params.cursor, sort_keys))]}
+    sort = [(key, ASCENDING) for key in sort_keys]
+    return query, projection, sort, params.limit or DEFAULT_PAGE_LIMIT
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+NDJSON_BATCH_SIZE = 500
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+async def ndjson_lines(cursor):
+    """Yield one JSON line per document straight off the Mongo cursor"""
+    async for doc in cursor:
+        yield dump_json(doc) + b"\n"
+
+async def load_page(collection, query: dict, projection: dict, sort, limit, sort_keys: tuple) -> tuple:
+    """Fetch one list page and the cursor for the page after it, if any"""
+    cursor = collection.find(query, projection)
+    if limit is None:
+        return await cursor.to_list(length=None), None
+    # Fetch one extra document to learn whether another page exists
+    docs = await cursor.sort(sort).limit(limit + 1).to_list(length=None)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1], sort_keys)
+    return docs, None
+
+async def fetch_list(collection, query: dict, params: ListParams, sort_keys: tuple, request: Request, response: Response,
+                     scope: Optional[str] = None, hidden: tuple = ()):
+    """Run a list query, honouring limit/cursor/fields and setting X-Next-Cursor.
+
+    With ``Accept: application/x-ndjson`` the cursor is streamed instead, one
+    document per line, so memory stays flat however large the result is. Streamed
+    pages are capped at ``limit`` but carry no X-Next-Cursor, since headers go out
+    before the last document is known. JSON reads of a catalog ``scope`` go
+    through ``catalog_cache``. ``hidden`` fields are left out of every document.
+    """
+    query, projection, sort, limit = list_query(query, params, sort_keys, hidden)
+
+    if wants_ndjson(request):
+        cursor = collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return StreamingResponse(
+            ndjson_lines(cursor.batch_size(NDJSON_BATCH_SIZE)),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=dict(response.headers),
+        )
+
+    def loader():
+        return load_page(collection, query, projection, sort, limit, sort_keys)
+
+    if scope:
+        docs, next_cursor = await catalog_cache.get(await catalog_cache_key(scope, request), scope, loader)
+    else:
+        docs, next_cursor = await loader()
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return docs
+
+# Bulk creation
+MAX_BULK_ITEMS = int(os.environ.get('MAX_BULK_ITEMS', '10000'))
+
+def validation_messages(error: ValidationError) -> list:
+    return [
+        {"loc": [str(part) for part in detail["loc"]], "msg": detail["msg"]}
+        for detail in error.errors()
+    ]
+
+async def bulk_create(collection, bulk: BulkCreate, model, build_doc, scope_of, user_id: str, on_inserted=None) -> dict:
+    """Validate each item with ``model``, insert the valid ones with one insert_many
+    and report a per-item result. ``on_inserted`` is awaited with the inserted docs.
+
+    Ordered requests stop at the first invalid or rejected item; everything after
+    it is reported as skipped. Unordered requests insert every valid item.
+    """
+    if len(bulk.items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} items per request")
+
+    results = [{"index": i, "status": "skipped"} for i in range(len(bulk.items))]
+    docs, positions = [], []
+    for i, raw in enumerate(bulk.items):
+        try:
+            doc = build_doc(model.model_validate(raw), user_id)
+        except ValidationError as e:
+            results[i] = {"index": i, "status": "error", "error": validation_messages(e)}
+        except HTTPException as e:
+            results[i] = {"index": i, "status": "error", "error": e.detail}
+        else:
+            docs.append(doc)
+            positions.append(i)
+            continue
+        if bulk.ordered:
+            break
+
+    inserted = set(range(len(docs)))
+    if docs:
+        try:
+            await collection.insert_many(docs, ordered=bulk.ordered)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            for write_error in write_errors:
+                inserted.discard(write_error["index"])
+                results[positions[write_error["index"]]] = {
+                    "index": positions[write_error["index"]],
+                    "status": "error",
+                    "error": write_error.get("errmsg", "Write failed"),
+                }
+            if bulk.ordered and write_errors:
+                # An ordered insert stops at its first failure
+                first_failure = min(write_error["index"] for write_error in write_errors)
+                inserted = {j for j in inserted if j < first_failure}
+
+    for j in inserted:
+        results[positions[j]] = {"index": positions[j], "status": "created", "id": docs[j]["id"]}
+    if inserted:
+        if on_inserted:
+            await on_inserted([docs[j] for j in sorted(inserted)])
+        await bump_versions(*{scope_of(docs[j]) for j in inserted})
+
+    return {
+        "inserted": len(inserted),
+        "failed": sum(1 for result in results if result["status"] == "error"),
+        "skipped": sum(1 for result in results if result["status"] == "skipped"),
+        "results": results,
+    }
+
+# Catalog versioning
+# Each list scope has a counter in db.versions that the create_* endpoints bump.
+# Read endpoints derive a strong ETag from it and answer 304 without touching
+# the documents when the client's copy is current.
+CATALOG_SCOPE = "catalog"
+# Scope versions are cached in process so a cache hit costs no Mongo round trip.
+# bump_versions drops the scopes it writes; other workers' writes are seen
+# within CATALOG_VERSION_TTL seconds.
+CATALOG_VERSION_TTL = float(os.environ.get('CATALOG_VERSION_TTL', '5'))
+CATALOG_VERSION_TIMEOUT = float(os.environ.get('CATALOG_VERSION_TIMEOUT', '0.5'))
+scope_versions = {}  # scope -> (version, checked_at)
+scope_generations = {}  # scope -> bump counter, so a lookup racing a bump isn't cached
+
+def version_scope(collection: str, parent_id: Optional[str] = None) -> str:
+    return f"{collection}:{parent_id}" if parent_id else collection
+
+def forget_versions(scopes: tuple):
+    for scope in scopes:
+        scope_generations[scope] = scope_generations.get(scope, 0) + 1
+        scope_versions.pop(scope, None)
+
+async def bump_versions(*scopes: str):
+    catalog_cache.invalidate(*scopes, CATALOG_SCOPE)
+    search_indexer.mark(*scopes)
+    forget_versions(scopes + (CATALOG_SCOPE,))
+    try:
+        await db.versions.bulk_write(
+            [UpdateOne({"_id": scope}, {"$inc": {"version": 1}}, upsert=True) for scope in scopes + (CATALOG_SCOPE,)],
+            ordered=False,
+        )
+    finally:
+        forget_versions(scopes + (CATALOG_SCOPE,))
+
+async def get_version(scope: str) -> Optional[int]:
+    """A scope's version, or the last one seen (None if never) when Mongo doesn't answer in time"""
+    cached = scope_versions.get(scope)
+    now = time.monotonic()
+    if cached and now - cached[1] < CATALOG_VERSION_TTL:
+        return cached[0]
+    generation = scope_generations.get(scope, 0)
+    try:
+        doc = await asyncio.wait_for(db.versions.find_one({"_id": scope}), CATALOG_VERSION_TIMEOUT)
+    except (PyMongoError, asyncio.TimeoutError):
+        if cached is None:
+            return None
+        # Keep using the last version without retrying Mongo on every request
+        scope_versions[scope] = (cached[0], now)
+        return cached[0]
+    version = doc["version"] if doc else 0
+    if scope_generations.get(scope, 0) == generation:
+        scope_versions[scope] = (version, now)
+    return version
+
+def make_etag(scope: str, version: int, request: Request) -> str:
+    # The query string and representation change the body, so they are part of the tag
+    variant = f"{scope}|{version}|{request.url.query}|{wants_ndjson(request)}"
+    return '"' + hashlib.sha256(variant.encode('utf-8')).hexdigest()[:32] + '"'
+
+ETAG_ENCODING_SUFFIX = re.compile(r'-(?:gzip|br)"$')
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # Tags from compressed responses carry an encoding suffix (see CompressionMiddleware)
+    candidates = [ETAG_ENCODING_SUFFIX.sub('"', tag.strip()) for tag in if_none_match.split(',')]
+    return "*" in candidates or etag in candidates
+
+async def check_not_modified(scope: str, request: Request, response: Response) -> Optional[Response]:
+    """Return a 304 response if the client's ETag is current, else tag the outgoing response"""
+    version = await get_version(scope)
+    if version is None:
+        # Mongo unreachable: skip revalidation and let the cache serve last-known-good data
+        return None
+    etag = make_etag(scope, version, request)
+    headers = {"ETag": etag, "Vary": "Accept"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Catalog cache
+class CatalogCache:
+    """Memory-bounded read-through cache for catalog reads.
+
+    Entries are fresh for ``ttl`` seconds, then served stale for up to
+    ``stale_ttl`` more while one background task reloads them. If a reload
+    fails because Mongo is unreachable (or doesn't answer within
+    ``fallback_timeout``), the last-known-good value is served regardless of age
+    and kept as stale, so later requests get it without waiting. ``invalidate`` drops every entry of a scope and discards
+    loads that were already in flight for it.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, stale_ttl: float, fallback_timeout: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fallback_timeout = fallback_timeout
+        self.entries = OrderedDict()  # key -> (value, loaded_at, size, scope)
+        self.generations = {}  # scope -> invalidation counter
+        self.refreshing = {}  # key -> background refresh task
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.fallback_hits = 0
+        self.evictions = 0
+
+    async def get(self, key, scope: str, loader):
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, loaded_at, _, _ = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self.refreshing:
+                    self.refreshing[key] = asyncio.create_task(self._refresh(key, scope, loader))
+                return value
+
+        self.misses += 1
+        generation = self.generations.get(scope, 0)
+        if entry is None:
+            value = await loader()
+        else:
+            # A last-known-good value exists, so don't wait out a full server-selection timeout
+            try:
+                value = await asyncio.wait_for(loader(), self.fallback_timeout)
+            except (PyMongoError, asyncio.TimeoutError):
+                self.fallback_hits += 1
+                if key in self.entries and self.generations.get(scope, 0) == generation:
+                    self.entries[key] = (entry[0], time.monotonic() - self.ttl, entry[2], entry[3])
+                return entry[0]
+        self._store(key, scope, value, generation)
+        return value
+
+    async def _refresh(self, key, scope: str, loader):
+        generation = self.generations.get(scope, 0)
+        try:
+            self._store(key, scope, await loader(), generation)
+        except PyMongoError as e:
+            logger.warning("Catalog cache refresh for %s failed, serving stale data: %s", key, e)
+        finally:
+            self.refreshing.pop(key, None)
+
+    def _store(self, key, scope: str, value, generation: int):
+        if self.generations.get(scope, 0) != generation:
+            return  # invalidated while loading; the value may predate the write
+        size = len(dump_json(value))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self.entries[key] = (value, time.monotonic(), size, scope)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def invalidate(self, *scopes: str):
+        for scope in scopes:
+            self.generations[scope] = self.generations.get(scope, 0) + 1
+        for key in [key for key, entry in self.entries.items() if entry[3] in scopes]:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fallback_hits": self.fallback_hits,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+catalog_cache = CatalogCache(
+    max_bytes=int(os.environ.get('CATALOG_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', '30')),
+    stale_ttl=float(os.environ.get('CATALOG_CACHE_STALE_TTL', '300')),
+    fallback_timeout=float(os.environ.get('CATALOG_CACHE_FALLBACK_TIMEOUT', '2')),
+)
+
+async def catalog_cache_key(scope: str, request: Request) -> tuple:
+    """Cache key for a catalog read. Another worker's write only invalidates its own
+    cache, so the scope version is part of the key: once this worker sees the new
+    version (and tags responses with it), the body cached at the old one is never used."""
+    return (scope, await get_version(scope), request.url.query)
+
+def list_from_memory(docs: list, params: ListParams, sort_keys: tuple, request: Request, response: Response):
+    """Apply the same cursor/limit/fields/NDJSON scheme as fetch_list to documents already in memory"""
+    projection = build_projection(params.fields, sort_keys)
+    docs = sorted(docs, key=lambda doc: tuple(doc.get(key) for key in sort_keys))
+    if params.paginated:
+        if params.cursor:
+            after = tuple(decode_cursor(params.cursor, sort_keys))
+            docs = [doc for doc in docs if tuple(doc.get(key) for key in sort_keys) > after]
+        limit = params.limit or DEFAULT_PAGE_LIMIT
+        if len(docs) > limit:
+            docs = docs[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(docs[-1], sort_keys)
+    if params.fields:
+        docs = [{key: value for key, value in doc.items() if key in projection} for doc in docs]
+    if wants_ndjson(request):
+        return StreamingResponse(
+            (dump_json(doc) + b"\n" for doc in docs),
+            media_type=NDJSON_MEDIA_TYPE,
+            headers=dict(response.headers),
+        )
+    return docs
+
+# Streaming uploads
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', '0'))  # 0 = no limit
+
+class StreamingUpload:
+    """Writes an upload to ``<path>.part`` in fixed-size chunks while hashing it,
+    then renames it into place, so only UPLOAD_CHUNK_SIZE bytes are ever buffered"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.part_path = path.with_name(path.name + ".part")
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.buffer = bytearray()
+        self.file = None
+
+    async def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = await asyncio.to_thread(open, self.part_path, 'wb')
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if UPLOAD_MAX_BYTES and self.size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Uploaded file is too large")
+        self.sha256.update(data)
+        self.buffer += data
+        while len(self.buffer) >= UPLOAD_CHUNK_SIZE:
+            chunk = bytes(self.buffer[:UPLOAD_CHUNK_SIZE])
+            del self.buffer[:UPLOAD_CHUNK_SIZE]
+            await asyncio.to_thread(self.file.write, chunk)
+
+    async def commit(self):
+        if self.buffer:
+            await asyncio.to_thread(self.file.write, bytes(self.buffer))
+            self.buffer.clear()
+        await asyncio.to_thread(self.file.close)
+        await asyncio.to_thread(os.replace, self.part_path, self.path)
+
+    async def discard(self):
+        if self.file and not self.file.closed:
+            await asyncio.to_thread(self.file.close)
+        await asyncio.to_thread(self.part_path.unlink, True)
+
+def upload_destination(filename: str) -> tuple:
+    """Pick the uploads/ subfolder from get_file_type and a collision-free stored name"""
+    file_type = get_file_type(filename)
+    subfolder = UPLOAD_SUBFOLDERS.get(file_type, "documents")
+    return file_type, UPLOAD_ROOT / subfolder / f"{uuid.uuid4()}{Path(filename).suffix.lower()}"
+
+async def receive_multipart_file(request: Request, start_upload) -> Optional[StreamingUpload]:
+    """Stream the first file part of a multipart body through ``start_upload(filename)``"""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Missing multipart boundary")
+
+    events = []
+    part_headers = {}
+    header = [b"", b""]
+
+    def on_part_begin():
+        part_headers.clear()
+
+    def on_header_field(data, start, end):
+        header[0] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        part_headers[header[0].lower()] = header[1]
+        header[0], header[1] = b"", b""
+
+    def on_headers_finished():
+        events.append(("headers", dict(part_headers)))
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    upload, receiving, done = None, False, False
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for kind, value in events:
+                if done:
+                    break
+                if kind == "headers":
+                    _, disposition = parse_options_header(value.get(b"content-disposition", b""))
+                    filename = disposition.get(b"filename")
+                    if upload is None and disposition.get(b"name") == b"file" and filename:
+                        upload = await start_upload(filename.decode('utf-8', 'replace'))
+                        receiving = True
+                elif kind == "data" and receiving:
+                    await upload.write(value)
+                elif kind == "end" and receiving:
+                    receiving, done = False, True
+            events.clear()
+        parser.finalize()
+    except BaseException:
+        if upload:
+            await upload.discard()
+        raise
+    if upload and not done:
+        await upload.discard()
+        raise HTTPException(status_code=400, detail="Upload ended before the file was complete")
+    return upload
+
+async def receive_raw_file(request: Request, upload: StreamingUpload):
+    """Stream a raw (non-multipart) request body into ``upload``"""
+    try:
+        async for chunk in request.stream():
+            await upload.write(chunk)
+    except BaseException:
+        await upload.discard()
+        raise
+
+def new_uploaded_content_doc(title: str, description: str, chapter_id: str, filename: str, file_type: str,
+                             stored_path: Path, size: int, sha256: str, user_id: str) -> dict:
+    """Content document for a file stored under uploads/, same shape as create_content plus file metadata"""
+    relative_path = stored_path.as_posix()
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "content_type": file_type,
+        "file_path": relative_path,
+        "content_data": relative_path,
+        "description": description,
+        "chapter_id": chapter_id,
+        "filename": filename,
+        "mime_type": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        "file_size": size,
+        "sha256": sha256,
+        "blob_id": sha256,
+        "created_by": user_id,
+        "created_at": datetime.utcnow()
+    }
+
+# Content-addressed blob storage
+# Uploaded bytes are stored once per SHA-256 as uploads/<subfolder>/<sha256><ext>.
+# db.blobs keeps {"_id": sha256, "path", "size", "ref_count"}; content documents
+# point at their blob through "blob_id". gc_blobs() recounts references from
+# content and removes blobs nobody points at any more.
+BLOB_GC_GRACE = int(os.environ.get('BLOB_GC_GRACE', '3600'))
+
+async def store_blob(source: Path, sha256: str, size: int, filename: str) -> Path:
+    """Take a reference on the blob for ``sha256``, moving ``source`` into place if the
+    bytes are new and discarding it if an identical blob already exists"""
+    subfolder = UPLOAD_SUBFOLDERS.get(get_file_type(filename), "documents")
+    candidate = (UPLOAD_ROOT / subfolder / f"{sha256}{Path(filename).suffix.lower()}").as_posix()
+    now = datetime.utcnow()
+    blob = await db.blobs.find_one_and_update(
+        {"_id": sha256},
+        {
+            "$inc": {"ref_count": 1},
+            "$set": {"last_referenced_at": now},
+            "$setOnInsert": {"path": candidate, "size": size, "created_at": now},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    blob_path = Path(blob["path"])
+
+    def place():
+        if blob_path.exists():
+            source.unlink(missing_ok=True)  # duplicate bytes; keep the existing copy
+        else:
+            # New bytes, or gc_blobs has moved a collected copy aside
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, blob_path)
+
+    await asyncio.to_thread(place)
+    return blob_path
+
+def bury_files(paths: list) -> list:
+    """Rename files to unique tombstones next to them; returns (tombstone, path) pairs"""
+    buried = []
+    for path in paths:
+        tombstone = path.with_name(f"{path.name}.gc-{uuid.uuid4().hex}")
+        try:
+            os.replace(path, tombstone)
+        except FileNotFoundError:
+            continue
+        buried.append((tombstone, path))
+    return buried
+
+def restore_files(buried: list):
+    for tombstone, path in buried:
+        if path.exists():
+            tombstone.unlink(missing_ok=True)  # an upload has already put a copy back
+        else:
+            os.replace(tombstone, path)
+
+async def release_blob(sha256: str):
+    await db.blobs.update_one({"_id": sha256}, {"$inc": {"ref_count": -1}})
+
+async def gc_blobs() -> dict:
+    """Recount blob references from content and delete blobs with none left.
+
+    Blobs referenced within the last BLOB_GC_GRACE seconds are kept, so an
+    upload that has stored its blob but not yet inserted its content survives.
+    """
+    counts = {
+        row["_id"]: row["count"]
+        async for row in db.content.aggregate([
+            {"$match": {"blob_id": {"$exists": True}}},
+            {"$group": {"_id": "$blob_id", "count": {"$sum": 1}}},
+        ])
+    }
+    cutoff = datetime.utcnow() - timedelta(seconds=BLOB_GC_GRACE)
+    removed = freed = 0
+    async for blob in db.blobs.find({}):
+        references = counts.get(blob["_id"], 0)
+        if references:
+            if references != blob.get("ref_count"):
+                await db.blobs.update_one({"_id": blob["_id"]}, {"$set": {"ref_count": references}})
+            continue
+        if blob.get("last_referenced_at", blob.get("created_at", cutoff)) > cutoff:
+            continue
+        # Move the files aside before deleting the record: an upload that re-creates
+        # the blob from here on finds its path empty and moves its own copy in,
+        # instead of discarding it in favour of a file about to be unlinked
+        paths = [Path(blob["path"])] + [Path(variant["path"]) for variant in blob.get("image", {}).get("variants", [])]
+        buried = await asyncio.to_thread(bury_files, paths)
+        result = await db.blobs.delete_one({"_id": blob["_id"], "last_referenced_at": blob.get("last_referenced_at")})
+        if not result.deleted_count:
+            # Referenced again since it was read
+            await asyncio.to_thread(restore_files, buried)
+            continue
+        for tombstone, _ in buried:
+            await asyncio.to_thread(tombstone.unlink, True)
+        removed += 1
+        freed += blob.get("size", 0)
+    return {"removed_blobs": removed, "freed_bytes": freed}
+
+async def blob_storage_report() -> dict:
+    """Bytes on disk versus bytes that would be stored without deduplication"""
+    rows = await db.blobs.aggregate([
+        {"$group": {
+            "_id": None,
+            "blobs": {"$sum": 1},
+            "stored_bytes": {"$sum": "$size"},
+            "logical_bytes": {"$sum": {"$multiply": ["$size", {"$max": ["$ref_count", 1]}]}},
+            "references": {"$sum": "$ref_count"},
+        }},
+    ]).to_list(length=1)
+    report = rows[0] if rows else {"blobs": 0, "stored_bytes": 0, "logical_bytes": 0, "references": 0}
+    report.pop("_id", None)
+    report["saved_bytes"] = report["logical_bytes"] - report["stored_bytes"]
+    return report
+
 def get_file_type(file_path: str) -> str:
     """Determine file type based on extension"""
     file_path = file_path.lower()
@@ -108,7 +1370,7 @@ def get_file_type(file_path: str) -> str:
         return 'presentation'
     elif file_path.endswith('.pdf'):
         return 'pdf'
-    elif file_path.endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg')):
+    elif file_path.endswith(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.tif', '.tiff', '.webp')):
         return 'image'
     elif file_path.endswith(('.mp4', '.avi', '.mov', '.wmv', '.flv', '.mkv', '.webm')):
         return 'video'
@@ -159,24 +1421,27 @@ async def root():
 # Authentication endpoints
 @app.post("/api/auth/signup")
 async def signup(user: UserCreate):
+    if user.role in ADMIN_ROLES:
+        raise HTTPException(status_code=403, detail="Admin roles cannot be self-assigned")
+
     # Check if user already exists
-    if db.users.find_one({"email": user.email}):
+    if await db.users.find_one({"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Hash password
-    hashed_password = bcrypt.hashpw(user.password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = await hash_password(user.password)
     
     # Create user
     user_id = str(uuid.uuid4())
     user_data = {
         "id": user_id,
         "email": user.email,
-        "password": hashed_password.decode('utf-8'),
+        "password": hashed_password,
         "role": user.role,
         "created_at": datetime.utcnow()
     }
     
-    db.users.insert_one(user_data)
+    await db.users.insert_one(user_data)
     
     # Create access token
     access_token = create_access_token({"user_id": user_id, "email": user.email})
@@ -186,7 +1451,7 @@ async def signup(user: UserCreate):
 @app.post("/api/auth/login")
 async def login(user: UserLogin):
     # Find user
-    db_user = db.users.find_one({"email": user.email})
+    db_user = await db.users.find_one({"email": user.email})
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -196,7 +1461,7 @@ async def login(user: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Verify password
-    if not bcrypt.checkpw(user.password.encode('utf-8'), password_hash.encode('utf-8')):
+    if not await check_password(user.password, password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create access token
@@ -205,77 +1470,116 @@ async def login(user: UserLogin):
     return {"access_token": access_token, "user": {"id": db_user["id"], "email": db_user["email"], "role": db_user["role"]}}
 
 # Classes endpoints
-@app.post("/api/classes/create")
-async def create_class(class_data: ClassCreate, user_id: str = Depends(verify_token)):
-    class_id = str(uuid.uuid4())
-    class_doc = {
-        "id": class_id,
+def new_class_doc(class_data: ClassCreate, user_id: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
         "name": class_data.name,
         "description": class_data.description,
         "grade": class_data.grade,
         "created_by": user_id,
         "created_at": datetime.utcnow()
     }
-    
-    db.classes.insert_one(class_doc)
+
+@app.post("/api/classes/create")
+async def create_class(class_data: ClassCreate, user_id: str = Depends(verify_token)):
+    class_doc = new_class_doc(class_data, user_id)
+    class_id = class_doc["id"]
+    await db.classes.insert_one(class_doc)
+    await bump_versions(version_scope("classes"))
     return {"class_id": class_id, "message": "Class created successfully"}
 
+@app.post("/api/classes/bulk-create")
+async def bulk_create_classes(bulk: BulkCreate, user_id: str = Depends(verify_token)):
+    return await bulk_create(db.classes, bulk, ClassCreate, new_class_doc, lambda doc: version_scope("classes"), user_id)
+
 @app.get("/api/classes")
-async def get_classes(user_id: str = Depends(verify_token)):
-    classes = list(db.classes.find({}, {"_id": 0}))
+async def get_classes(request: Request, response: Response, params: ListParams = Depends(), user_id: str = Depends(verify_token)):
+    scope = version_scope("classes")
+    not_modified = await check_not_modified(scope, request, response)
+    if not_modified:
+        return not_modified
+    classes = await fetch_list(db.classes, {}, params, CATALOG_SORT_KEYS, request, response, scope=scope)
     return classes
 
 # Subjects endpoints
-@app.post("/api/subjects/create")
-async def create_subject(subject_data: SubjectCreate, user_id: str = Depends(verify_token)):
-    subject_id = str(uuid.uuid4())
-    subject_doc = {
-        "id": subject_id,
+def new_subject_doc(subject_data: SubjectCreate, user_id: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
         "name": subject_data.name,
         "description": subject_data.description,
         "class_id": subject_data.class_id,
         "created_by": user_id,
         "created_at": datetime.utcnow()
     }
-    
-    db.subjects.insert_one(subject_doc)
+
+@app.post("/api/subjects/create")
+async def create_subject(subject_data: SubjectCreate, user_id: str = Depends(verify_token)):
+    subject_doc = new_subject_doc(subject_data, user_id)
+    subject_id = subject_doc["id"]
+    await db.subjects.insert_one(subject_doc)
+    await bump_versions(version_scope("subjects", subject_data.class_id))
     return {"subject_id": subject_id, "message": "Subject created successfully"}
 
+@app.post("/api/subjects/bulk-create")
+async def bulk_create_subjects(bulk: BulkCreate, user_id: str = Depends(verify_token)):
+    return await bulk_create(
+        db.subjects, bulk, SubjectCreate, new_subject_doc, lambda doc: version_scope("subjects", doc["class_id"]), user_id
+    )
+
 @app.get("/api/subjects/{class_id}")
-async def get_subjects(class_id: str, user_id: str = Depends(verify_token)):
-    subjects = list(db.subjects.find({"class_id": class_id}, {"_id": 0}))
+async def get_subjects(class_id: str, request: Request, response: Response, params: ListParams = Depends(), user_id: str = Depends(verify_token)):
+    scope = version_scope("subjects", class_id)
+    not_modified = await check_not_modified(scope, request, response)
+    if not_modified:
+        return not_modified
+    subjects = await fetch_list(db.subjects, {"class_id": class_id}, params, CATALOG_SORT_KEYS, request, response, scope=scope)
     return subjects
 
 # Chapters endpoints
-@app.post("/api/chapters/create")
-async def create_chapter(chapter_data: ChapterCreate, user_id: str = Depends(verify_token)):
-    chapter_id = str(uuid.uuid4())
-    chapter_doc = {
-        "id": chapter_id,
+def new_chapter_doc(chapter_data: ChapterCreate, user_id: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
         "name": chapter_data.name,
         "description": chapter_data.description,
         "subject_id": chapter_data.subject_id,
         "created_by": user_id,
         "created_at": datetime.utcnow()
     }
-    
-    db.chapters.insert_one(chapter_doc)
+
+@app.post("/api/chapters/create")
+async def create_chapter(chapter_data: ChapterCreate, user_id: str = Depends(verify_token)):
+    chapter_doc = new_chapter_doc(chapter_data, user_id)
+    chapter_id = chapter_doc["id"]
+    await db.chapters.insert_one(chapter_doc)
+    await increment_chapter_totals([chapter_doc])
+    await bump_versions(version_scope("chapters", chapter_data.subject_id))
     return {"chapter_id": chapter_id, "message": "Chapter created successfully"}
 
+@app.post("/api/chapters/bulk-create")
+async def bulk_create_chapters(bulk: BulkCreate, user_id: str = Depends(verify_token)):
+    return await bulk_create(
+        db.chapters, bulk, ChapterCreate, new_chapter_doc, lambda doc: version_scope("chapters", doc["subject_id"]), user_id,
+        on_inserted=increment_chapter_totals,
+    )
+
 @app.get("/api/chapters/{subject_id}")
-async def get_chapters(subject_id: str, user_id: str = Depends(verify_token)):
-    chapters = list(db.chapters.find({"subject_id": subject_id}, {"_id": 0}))
+async def get_chapters(subject_id: str, request: Request, response: Response, params: ListParams = Depends(), user_id: str = Depends(verify_token)):
+    scope = version_scope("chapters", subject_id)
+    not_modified = await check_not_modified(scope, request, response)
+    if not_modified:
+        return not_modified
+    chapters = await fetch_list(db.chapters, {"subject_id": subject_id}, params, CATALOG_SORT_KEYS, request, response, scope=scope)
     return chapters
 
 @app.get("/api/chapter/{chapter_id}")
 async def get_chapter_details(chapter_id: str, user_id: str = Depends(verify_token)):
-    chapter = db.chapters.find_one({"id": chapter_id}, {"_id": 0})
+    chapter = await db.chapters.find_one({"id": chapter_id}, {"_id": 0})
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
     
     # Get subject and class info
-    subject = db.subjects.find_one({"id": chapter["subject_id"]}, {"_id": 0})
-    class_info = db.classes.find_one({"id": subject["class_id"]}, {"_id": 0}) if subject else None
+    subject = await db.subjects.find_one({"id": chapter["subject_id"]}, {"_id": 0})
+    class_info = await db.classes.find_one({"id": subject["class_id"]}, {"_id": 0}) if subject else None
     
     return {
         "chapter": chapter,
@@ -283,9 +1587,109 @@ async def get_chapter_details(chapter_id: str, user_id: str = Depends(verify_tok
         "class": class_info
     }
 
+@app.get("/api/chapter/{chapter_id}/view")
+async def get_chapter_view(chapter_id: str, user_id: str = Depends(verify_token)):
+    """Chapter, subject, class, content list and the caller's progress in one aggregation"""
+    pipeline = [
+        {"$match": {"id": chapter_id}},
+        {"$limit": 1},
+        {"$lookup": {"from": "subjects", "localField": "subject_id", "foreignField": "id", "as": "subject"}},
+        {"$unwind": {"path": "$subject", "preserveNullAndEmptyArrays": True}},
+        {"$lookup": {"from": "classes", "localField": "subject.class_id", "foreignField": "id", "as": "class"}},
+        {"$unwind": {"path": "$class", "preserveNullAndEmptyArrays": True}},
+        {"$lookup": {
+            "from": "content",
+            "localField": "id",
+            "foreignField": "chapter_id",
+            "pipeline": [{"$project": {"_id": 0}}],
+            "as": "content",
+        }},
+        {"$project": {"_id": 0, "subject._id": 0, "class._id": 0}},
+    ]
+    if not PROGRESS_STORAGE_COMPACT:
+        pipeline.insert(-1, {"$lookup": {
+            "from": "progress",
+            "let": {"chapter_id": "$id"},
+            "pipeline": [
+                {"$match": {"user_id": user_id, "$expr": {"$eq": ["$chapter_id", "$$chapter_id"]}}},
+                {"$project": {"_id": 0, "counted": 0}},
+                {"$limit": 1},
+            ],
+            "as": "progress",
+        }})
+    results = await db.chapters.aggregate(pipeline).to_list(length=1)
+    if not results:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+
+    view = results[0]
+    subject = view.pop("subject", None)
+    class_info = view.pop("class", None)
+    content = view.pop("content", [])
+    progress = view.pop("progress", [])
+    if PROGRESS_STORAGE_COMPACT:
+        progress = [doc for doc in await read_progress(user_id) if doc["chapter_id"] == chapter_id]
+    if progress_buffer:
+        progress = [doc for doc in progress_buffer.merge(user_id, progress) if doc["chapter_id"] == chapter_id]
+    return {
+        "chapter": view,
+        "subject": subject,
+        "class": class_info,
+        "content": content,
+        "progress": progress[0] if progress else None,
+    }
+
+# Catalog endpoints
+CATALOG_DEPTH_CLASSES = 1
+CATALOG_DEPTH_SUBJECTS = 2
+CATALOG_DEPTH_CHAPTERS = 3
+
+async def build_catalog_tree(class_filter: dict, depth: int) -> list:
+    """Assemble Classes -> Subjects -> Chapters with one batched $in query per level"""
+    classes = await db.classes.find(class_filter, {"_id": 0}).to_list(length=None)
+    if depth < CATALOG_DEPTH_SUBJECTS or not classes:
+        return classes
+
+    class_ids = [cls["id"] for cls in classes]
+    subjects = await db.subjects.find({"class_id": {"$in": class_ids}}, {"_id": 0}).to_list(length=None)
+
+    if depth >= CATALOG_DEPTH_CHAPTERS and subjects:
+        subject_ids = [subject["id"] for subject in subjects]
+        chapters = await db.chapters.find({"subject_id": {"$in": subject_ids}}, {"_id": 0}).to_list(length=None)
+        chapters_by_subject = {}
+        for chapter in chapters:
+            chapters_by_subject.setdefault(chapter["subject_id"], []).append(chapter)
+        for subject in subjects:
+            subject["chapters"] = chapters_by_subject.get(subject["id"], [])
+
+    subjects_by_class = {}
+    for subject in subjects:
+        subjects_by_class.setdefault(subject["class_id"], []).append(subject)
+    for cls in classes:
+        cls["subjects"] = subjects_by_class.get(cls["id"], [])
+    return classes
+
+@app.get("/api/catalog/tree")
+async def get_catalog_tree(
+    request: Request,
+    response: Response,
+    depth: int = Query(CATALOG_DEPTH_CHAPTERS, ge=CATALOG_DEPTH_CLASSES, le=CATALOG_DEPTH_CHAPTERS),
+    class_id: Optional[str] = None,
+    user_id: str = Depends(verify_token),
+):
+    """Whole catalog hierarchy in one call; depth 1 = classes, 2 = +subjects, 3 = +chapters"""
+    not_modified = await check_not_modified(CATALOG_SCOPE, request, response)
+    if not_modified:
+        return not_modified
+    class_filter = {"id": class_id} if class_id else {}
+    tree = await catalog_cache.get(
+        await catalog_cache_key(CATALOG_SCOPE, request), CATALOG_SCOPE, lambda: build_catalog_tree(class_filter, depth)
+    )
+    if class_id and not tree:
+        raise HTTPException(status_code=404, detail="Class not found")
+    return tree
+
 # Content endpoints
-@app.post("/api/content/create")
-async def create_content(content_data: ContentCreate, user_id: str = Depends(verify_token)):
+def new_content_doc(content_data: ContentCreate, user_id: str) -> dict:
     # Validate file path
     if not is_valid_path(content_data.file_path):
         raise HTTPException(status_code=400, detail="Invalid file path or file does not exist")
@@ -294,9 +1698,8 @@ async def create_content(content_data: ContentCreate, user_id: str = Depends(ver
     if content_data.content_type == "auto":
         content_data.content_type = get_file_type(content_data.file_path)
     
-    content_id = str(uuid.uuid4())
-    content_doc = {
-        "id": content_id,
+    return {
+        "id": str(uuid.uuid4()),
         "title": content_data.title,
         "content_type": content_data.content_type,
         "file_path": content_data.file_path,
@@ -305,19 +1708,89 @@ async def create_content(content_data: ContentCreate, user_id: str = Depends(ver
         "created_by": user_id,
         "created_at": datetime.utcnow()
     }
-    
-    db.content.insert_one(content_doc)
+
+@app.post("/api/content/create")
+async def create_content(content_data: ContentCreate, user_id: str = Depends(verify_token)):
+    content_doc = new_content_doc(content_data, user_id)
+    content_id = content_doc["id"]
+    await db.content.insert_one(content_doc)
+    await bump_versions(version_scope("content", content_data.chapter_id))
     return {"content_id": content_id, "message": "Content created successfully"}
 
+@app.post("/api/content/bulk-create")
+async def bulk_create_content(bulk: BulkCreate, user_id: str = Depends(verify_token)):
+    return await bulk_create(
+        db.content, bulk, ContentCreate, new_content_doc, lambda doc: version_scope("content", doc["chapter_id"]), user_id
+    )
+
+@app.post("/api/content/upload-file")
+async def upload_content_file(
+    request: Request,
+    chapter_id: str,
+    title: str,
+    description: str = "",
+    filename: Optional[str] = None,
+    user_id: str = Depends(verify_token),
+):
+    """Stream an uploaded file to uploads/ and create its content item once the write completes.
+
+    Accepts multipart/form-data with a ``file`` part, or a raw request body with
+    the name given in ``?filename=``.
+    """
+    details = {}
+
+    async def start_upload(name: str) -> StreamingUpload:
+        details["filename"] = Path(name.replace('\\', '/')).name
+        details["file_type"], path = upload_destination(details["filename"])
+        upload = StreamingUpload(path)
+        await upload.open()
+        return upload
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        upload = await receive_multipart_file(request, start_upload)
+        if upload is None:
+            raise HTTPException(status_code=400, detail="No file part named 'file' in upload")
+    else:
+        if not filename:
+            raise HTTPException(status_code=400, detail="filename query parameter is required for raw uploads")
+        upload = await start_upload(filename)
+        await receive_raw_file(request, upload)
+    await upload.commit()
+    sha256 = upload.sha256.hexdigest()
+    blob_path = await store_blob(upload.path, sha256, upload.size, details["filename"])
+
+    content_doc = new_uploaded_content_doc(
+        title, description, chapter_id, details["filename"], details["file_type"],
+        blob_path, upload.size, sha256, user_id,
+    )
+    try:
+        await db.content.insert_one(content_doc)
+    except PyMongoError:
+        await release_blob(sha256)
+        raise
+    await bump_versions(version_scope("content", chapter_id))
+    await enqueue_ingest_jobs(content_doc)
+    return {
+        "content_id": content_doc["id"],
+        "file_path": content_doc["file_path"],
+        "file_size": upload.size,
+        "sha256": content_doc["sha256"],
+        "message": "File uploaded successfully",
+    }
+
 @app.get("/api/content/{chapter_id}")
-async def get_content(chapter_id: str, user_id: str = Depends(verify_token)):
-    content = list(db.content.find({"chapter_id": chapter_id}, {"_id": 0}))
+async def get_content(chapter_id: str, request: Request, response: Response, params: ListParams = Depends(), user_id: str = Depends(verify_token)):
+    scope = version_scope("content", chapter_id)
+    not_modified = await check_not_modified(scope, request, response)
+    if not_modified:
+        return not_modified
+    content = await fetch_list(db.content, {"chapter_id": chapter_id}, params, CATALOG_SORT_KEYS, request, response, scope=scope)
     return content
 
 @app.get("/api/content/open/{content_id}")
 async def open_content(content_id: str, user_id: str = Depends(verify_token)):
     """Open content file using system default application"""
-    content = db.content.find_one({"id": content_id}, {"_id": 0})
+    content = await db.content.find_one({"id": content_id}, {"_id": 0})
     if not content:
         raise HTTPException(status_code=404, detail="Content not found")
     
@@ -329,7 +1802,7 @@ async def open_content(content_id: str, user_id: str = Depends(verify_token)):
     
     # If it's a URL, return the URL
     if file_path.startswith(('http://', 'https://')):
-        return {"type": "url", "path": file_path}
+        return {"type": "url", "path": file_path, "health": content.get("health", {}).get("status")}
     
     # If it's a local file, check if it exists (basic validation)
     if not is_valid_path(file_path):
@@ -347,33 +1820,2147 @@ async def open_content(content_id: str, user_id: str = Depends(verify_token)):
         "type": "file",
         "path": file_path,
         "content_type": content.get("content_type", "file"),
-        "title": content["title"]
+        "title": content["title"],
+        "health": content.get("health", {}).get("status")
+    }
+
+# Search
+# search_index holds one document per class, subject, chapter and content item
+# with its title, description, grade and lineage, a weighted text index for
+# ranked search, and the words and word prefixes of its title for type-ahead. Catalog
+# writes already bump version scopes; those scopes are re-indexed shortly after
+# by search_indexer, and rebuild_search_index() rebuilds everything.
+SEARCH_SOURCES = {  # collection -> (kind, rank, title field, parent field)
+    "classes": ("class", 0, "name", None),
+    "subjects": ("subject", 1, "name", "class_id"),
+    "chapters": ("chapter", 2, "name", "subject_id"),
+    "content": ("content", 3, "title", "chapter_id"),
+}
+SEARCH_MAX_PREFIX = int(os.environ.get('SEARCH_MAX_PREFIX', '12'))
+SEARCH_REFRESH_DELAY = float(os.environ.get('SEARCH_REFRESH_DELAY', '0.5'))
+SEARCH_BATCH_SIZE = 1000
+
+def search_terms(text: str) -> list:
+    # Keep combining marks inside words so Devanagari vowel signs don't split them
+    return "".join(
+        char if char.isalnum() or unicodedata.category(char).startswith("M") else " "
+        for char in (text or "").lower()
+    ).split()
+
+def title_prefixes(title: str) -> list:
+    prefixes = set()
+    for word in search_terms(title):
+        prefixes.update(word[:length] for length in range(1, min(len(word), SEARCH_MAX_PREFIX) + 1))
+    return sorted(prefixes)
+
+async def build_search_docs(collection: str, docs: list) -> list:
+    """Turn catalog documents into search_index documents, resolving class, subject and grade"""
+    kind, rank, title_field, parent_field = SEARCH_SOURCES[collection]
+    lineage = {}  # doc id -> (class_id, subject_id, chapter_id)
+    if collection in ("chapters", "content"):
+        chapter_key = "id" if collection == "chapters" else "chapter_id"
+        scopes = await chapter_scopes(list({doc.get(chapter_key) for doc in docs}))
+        for doc in docs:
+            subject_id, class_id = scopes.get(doc.get(chapter_key), (None, None))
+            lineage[doc["id"]] = (class_id, subject_id, doc.get(chapter_key))
+    elif collection == "subjects":
+        lineage = {doc["id"]: (doc.get("class_id"), doc["id"], None) for doc in docs}
+    else:
+        lineage = {doc["id"]: (doc["id"], None, None) for doc in docs}
+    class_ids = list({class_id for class_id, _, _ in lineage.values() if class_id})
+    grades = {
+        cls["id"]: cls.get("grade")
+        async for cls in db.classes.find({"id": {"$in": class_ids}}, {"_id": 0, "id": 1, "grade": 1})
     }
 
+    now = datetime.utcnow()
+    search_docs = []
+    for doc in docs:
+        class_id, subject_id, chapter_id = lineage[doc["id"]]
+        title = doc.get(title_field) or ""
+        search_doc = {
+            "_id": f"{kind}:{doc['id']}",
+            "kind": kind,
+            "id": doc["id"],
+            "rank": rank,
+            "title": title,
+            "description": doc.get("description") or "",
+            "grade": grades.get(class_id),
+            "class_id": class_id,
+            "subject_id": subject_id,
+            "chapter_id": chapter_id,
+            "scope": version_scope(collection, doc.get(parent_field) if parent_field else None),
+            "words": sorted(set(search_terms(title))),
+            "title_length": len(title),
+            "prefixes": title_prefixes(title),
+            "indexed_at": now,
+        }
+        if kind == "content":
+            search_doc["content_type"] = doc.get("content_type")
+        search_docs.append(search_doc)
+    return search_docs
+
+async def write_search_docs(collection: str, docs: list):
+    search_docs = await build_search_docs(collection, docs)
+    if search_docs:
+        await db.search_index.bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in search_docs], ordered=False
+        )
+    return [doc["_id"] for doc in search_docs]
+
+async def refresh_search_scope(scope: str):
+    """Re-index the documents under one version scope, dropping ones that are gone"""
+    collection, _, parent_id = scope.partition(":")
+    parent_field = SEARCH_SOURCES[collection][3]
+    query = {parent_field: parent_id} if parent_field and parent_id else {}
+    projection = {"_id": 0, "id": 1, "name": 1, "title": 1, "description": 1, "grade": 1,
+                  "class_id": 1, "subject_id": 1, "chapter_id": 1, "content_type": 1}
+    indexed = []
+    batch = []
+    async for doc in db[collection].find(query, projection):
+        batch.append(doc)
+        if len(batch) >= SEARCH_BATCH_SIZE:
+            indexed += await write_search_docs(collection, batch)
+            batch = []
+    indexed += await write_search_docs(collection, batch)
+    await db.search_index.delete_many({"scope": scope, "_id": {"$nin": indexed}})
+
+async def rebuild_search_index() -> dict:
+    """Re-index the whole catalog and drop search documents for anything deleted"""
+    started = datetime.utcnow()
+    counts = {}
+    for collection in SEARCH_SOURCES:
+        counts[collection] = 0
+        batch = []
+        async for doc in db[collection].find({}, {"_id": 0}):
+            batch.append(doc)
+            if len(batch) >= SEARCH_BATCH_SIZE:
+                counts[collection] += len(await write_search_docs(collection, batch))
+                batch = []
+        counts[collection] += len(await write_search_docs(collection, batch))
+    removed = await db.search_index.delete_many({"indexed_at": {"$lt": started}})
+    return {"indexed": counts, "removed": removed.deleted_count}
+
+class SearchIndexer:
+    """Re-index version scopes touched by catalog writes, coalescing bursts of writes"""
+
+    def __init__(self):
+        self.pending = set()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def mark(self, *scopes: str):
+        self.pending.update(scope for scope in scopes if scope.partition(":")[0] in SEARCH_SOURCES)
+        if self.pending:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(SEARCH_REFRESH_DELAY)
+            self.wakeup.clear()
+            scopes, self.pending = self.pending, set()
+            for scope in scopes:
+                try:
+                    await refresh_search_scope(scope)
+                except PyMongoError as e:
+                    logger.error("Search refresh of %s failed: %s", scope, e)
+                    self.mark(scope)
+
+search_indexer = SearchIndexer()
+
+@app.on_event("startup")
+async def start_search_indexer():
+    search_indexer.task = asyncio.create_task(search_indexer.run())
+    try:
+        # First start with search, or documents indexed before type-ahead stored
+        # title_length: (re)index whatever catalog already exists
+        if (
+            not await db.search_index.estimated_document_count()
+            or await db.search_index.find_one({"title_length": {"$exists": False}}, {"_id": 1})
+        ):
+            for collection in SEARCH_SOURCES:
+                search_indexer.mark(collection)
+    except PyMongoError as e:
+        logger.error("Search index check failed: %s", e)
+
+@app.on_event("shutdown")
+async def stop_search_indexer():
+    if search_indexer.task:
+        search_indexer.task.cancel()
+
+@app.get("/api/search")
+async def search_catalog(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    prefix: bool = Query(False, description="Match the last word as a prefix (type-ahead)"),
+    kind: Optional[str] = Query(None, pattern="^(class|subject|chapter|content)$"),
+    content_type: Optional[str] = None,
+    grade: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_LIMIT),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(verify_token),
+):
+    """Relevance-ranked search over class, subject and chapter names and content titles and descriptions"""
+    words = search_terms(q)
+    if not words:
+        return []
+    query = {}
+    if kind:
+        query["kind"] = kind
+    if content_type:
+        query["content_type"] = content_type
+    if grade:
+        query["grade"] = grade
+    if prefix:
+        *complete, partial = words
+        query["prefixes"] = partial[:SEARCH_MAX_PREFIX]
+        if complete:
+            query["$text"] = {"$search": " ".join(complete)}
+    else:
+        query["$text"] = {"$search": " ".join(words)}
+
+    # Relevance order has no stable key to seek on, so the cursor carries an offset
+    offset = decode_cursor(cursor, ("offset",))[0] if cursor else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    projection = {"_id": 0, "words": 0, "title_length": 0, "prefixes": 0, "scope": 0, "indexed_at": 0, "rank": 0}
+    if "$text" in query:
+        projection["score"] = {"$meta": "textScore"}
+        sort = [("score", {"$meta": "textScore"}), ("rank", ASCENDING), ("_id", ASCENDING)]
+        results = await db.search_index.find(query, projection).sort(sort).skip(offset).limit(limit + 1).to_list(length=limit + 1)
+    else:
+        # Type-ahead alone has no text score. Titles that already contain the word
+        # whole come first, then the other prefix matches; both are read off an
+        # index in (title_length, rank) order, so no query sorts in memory.
+        order = [("title_length", ASCENDING), ("rank", ASCENDING), ("_id", ASCENDING)]
+        filters = {key: value for key, value in query.items() if key != "prefixes"}
+        exact = {**filters, "words": partial}
+        results = await db.search_index.find(exact, projection).sort(order).skip(offset).limit(limit + 1).to_list(length=limit + 1)
+        if len(results) <= limit:
+            # The exact matches ran out inside this page (or before it): carry on into the rest
+            skip = 0 if results or not offset else offset - await db.search_index.count_documents(exact, limit=offset)
+            wanted = limit + 1 - len(results)
+            rest = db.search_index.find({**query, "words": {"$ne": partial}}, projection)
+            results += await rest.sort(order).skip(skip).limit(wanted).to_list(length=wanted)
+    if len(results) > limit:
+        results = results[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor({"offset": offset + limit}, ("offset",))
+    return results
+
+# Resumable uploads
+# A session preallocates uploads/sessions/<id>.part; clients PUT byte ranges at
+# explicit offsets (in parallel if they like), can ask which ranges arrived, and
+# finalize once the file is complete. Sessions idle past their TTL are swept.
+UPLOAD_SESSION_DIR = UPLOAD_ROOT / "sessions"
+UPLOAD_SESSION_CHUNK_SIZE = int(os.environ.get('UPLOAD_SESSION_CHUNK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', str(24 * 3600)))
+UPLOAD_SESSION_SWEEP_INTERVAL = int(os.environ.get('UPLOAD_SESSION_SWEEP_INTERVAL', '300'))
+HASH_READ_SIZE = 4 * 1024 * 1024
+
+def merge_ranges(ranges: list) -> list:
+    """Merge [start, end) byte ranges into a sorted, non-overlapping list"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def session_status(session: dict) -> dict:
+    received = merge_ranges(session.get("ranges", []))
+    contiguous = received[0][1] if received and received[0][0] == 0 else 0
+    return {
+        "session_id": session["_id"],
+        "filename": session["filename"],
+        "size": session["size"],
+        "offset": contiguous,
+        "received_bytes": sum(end - start for start, end in received),
+        "received_ranges": received,
+        "chunk_size": UPLOAD_SESSION_CHUNK_SIZE,
+        "status": session["status"],
+        "expires_at": session["expires_at"],
+    }
+
+def session_part_path(session_id: str) -> Path:
+    return UPLOAD_SESSION_DIR / f"{session_id}.part"
+
+def preallocate_file(path: Path, size: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'wb') as part:
+        part.truncate(size)
+
+def write_at(path: Path, offset: int, data: bytes):
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+def sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(HASH_READ_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+async def get_upload_session(session_id: str, user_id: str) -> dict:
+    session = await db.upload_sessions.find_one({"_id": session_id, "user_id": user_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+async def sweep_upload_sessions() -> int:
+    """Delete sessions (and their partial files) that have been idle past their TTL"""
+    expired = await db.upload_sessions.find(
+        {"expires_at": {"$lt": datetime.utcnow()}}, {"_id": 1, "sha256": 1}
+    ).to_list(length=None)
+    for session in expired:
+        await asyncio.to_thread(session_part_path(session["_id"]).unlink, True)
+        if session.get("sha256"):
+            await release_blob(session["sha256"])  # stored by a finalize that never completed
+        await db.upload_sessions.delete_one({"_id": session["_id"]})
+    return len(expired)
+
+async def run_upload_session_sweeper():
+    while True:
+        try:
+            swept = await sweep_upload_sessions()
+            if swept:
+                logger.info("Swept %d expired upload sessions", swept)
+        except Exception as e:
+            logger.error("Upload session sweep failed: %s", e)
+        await asyncio.sleep(UPLOAD_SESSION_SWEEP_INTERVAL)
+
+upload_sweeper_task = None
+
+@app.on_event("startup")
+async def start_upload_session_sweeper():
+    global upload_sweeper_task
+    upload_sweeper_task = asyncio.create_task(run_upload_session_sweeper())
+
+@app.on_event("shutdown")
+async def stop_upload_session_sweeper():
+    if upload_sweeper_task:
+        upload_sweeper_task.cancel()
+
+@app.post("/api/uploads/sessions")
+async def create_upload_session(session_data: UploadSessionCreate, user_id: str = Depends(verify_token)):
+    if session_data.size <= 0:
+        raise HTTPException(status_code=400, detail="size must be positive")
+    if UPLOAD_MAX_BYTES and session_data.size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Uploaded file is too large")
+    session_id = str(uuid.uuid4())
+    await asyncio.to_thread(preallocate_file, session_part_path(session_id), session_data.size)
+    session = {
+        "_id": session_id,
+        "user_id": user_id,
+        "filename": Path(session_data.filename.replace('\\', '/')).name,
+        "size": session_data.size,
+        "chapter_id": session_data.chapter_id,
+        "title": session_data.title,
+        "description": session_data.description,
+        "ranges": [],
+        "status": "open",
+        "created_at": datetime.utcnow(),
+        "expires_at": datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL),
+    }
+    await db.upload_sessions.insert_one(session)
+    return session_status(session)
+
+@app.get("/api/uploads/sessions/{session_id}")
+async def get_upload_session_status(session_id: str, user_id: str = Depends(verify_token)):
+    """Report which byte ranges have arrived; ``offset`` is where a sequential client resumes"""
+    return session_status(await get_upload_session(session_id, user_id))
+
+@app.put("/api/uploads/sessions/{session_id}")
+async def put_upload_chunk(session_id: str, request: Request, offset: int = Query(..., ge=0), user_id: str = Depends(verify_token)):
+    """Write the raw request body at ``offset``; chunks may arrive in any order and in parallel"""
+    session = await get_upload_session(session_id, user_id)
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail="Upload session is already being finalized")
+    if offset >= session["size"]:
+        raise HTTPException(status_code=416, detail="Offset is beyond the end of the file")
+
+    path = session_part_path(session_id)
+    position = offset
+    buffer = bytearray()
+    async for data in request.stream():
+        buffer += data
+        if position + len(buffer) > session["size"]:
+            raise HTTPException(status_code=416, detail="Chunk runs past the declared file size")
+        if len(buffer) >= UPLOAD_CHUNK_SIZE:
+            await asyncio.to_thread(write_at, path, position, bytes(buffer))
+            position += len(buffer)
+            buffer.clear()
+    if buffer:
+        await asyncio.to_thread(write_at, path, position, bytes(buffer))
+        position += len(buffer)
+
+    # Only a fully received body is recorded, so a dropped PUT is simply retried
+    if position > offset:
+        session = await db.upload_sessions.find_one_and_update(
+            {"_id": session_id},
+            {
+                "$push": {"ranges": [offset, position]},
+                "$set": {"expires_at": datetime.utcnow() + timedelta(seconds=UPLOAD_SESSION_TTL)},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        if not session:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+    return session_status(session)
+
+@app.post("/api/uploads/sessions/{session_id}/finalize")
+async def finalize_upload_session(session_id: str, user_id: str = Depends(verify_token)):
+    """Verify every byte arrived, move the file into uploads/ and create its content item"""
+    session = await get_upload_session(session_id, user_id)
+    received = merge_ranges(session.get("ranges", []))
+    if received != [[0, session["size"]]]:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Upload is incomplete", "size": session["size"], "received_ranges": received},
+        )
+    # "stored" means an earlier finalize already moved the file into the blob store
+    session = await db.upload_sessions.find_one_and_update(
+        {"_id": session_id, "status": {"$in": ["open", "stored"]}},
+        {"$set": {"status": "finalizing"}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not session:
+        raise HTTPException(status_code=409, detail="Upload session is already being finalized")
+
+    resume = {"status": "open"}
+    try:
+        if session.get("blob_path"):
+            sha256, blob_path = session["sha256"], Path(session["blob_path"])
+        else:
+            part_path = session_part_path(session_id)
+            sha256 = await asyncio.to_thread(sha256_file, part_path)
+            blob_path = await store_blob(part_path, sha256, session["size"], session["filename"])
+            session["content_id"] = str(uuid.uuid4())
+        # The part file is gone and the blob reference belongs to the session until its
+        # content item exists, so a failure from here on leaves it resumable as "stored"
+        resume = {"status": "stored", "sha256": sha256, "blob_path": blob_path.as_posix(),
+                  "content_id": session["content_id"]}
+
+        content_doc = new_uploaded_content_doc(
+            session["title"], session["description"], session["chapter_id"], session["filename"],
+            get_file_type(session["filename"]), blob_path, session["size"], sha256, user_id,
+        )
+        content_doc["id"] = session["content_id"]  # stable across retries, so a retry can't insert twice
+        try:
+            await db.content.insert_one(content_doc)
+        except DuplicateKeyError:
+            pass  # inserted by an earlier attempt that failed afterwards
+    except Exception:
+        await db.upload_sessions.update_one({"_id": session_id}, {"$set": resume})
+        raise
+    await db.upload_sessions.delete_one({"_id": session_id})
+    await bump_versions(version_scope("content", session["chapter_id"]))
+    await enqueue_ingest_jobs(content_doc)
+    return {
+        "content_id": content_doc["id"],
+        "file_path": content_doc["file_path"],
+        "file_size": session["size"],
+        "sha256": sha256,
+        "message": "File uploaded successfully",
+    }
+
+# Media serving
+# Uploaded media is served with Range support (single and multi-range), strong
+# ETags and Last-Modified. Bytes are sent with the ASGI zero-copy extension when
+# the server offers it, otherwise with positioned reads, so a seek never reads
+# the file from the start. With MEDIA_ACCEL_REDIRECT set (e.g. "/protected-uploads/"),
+# nginx is told to send the file itself via X-Accel-Redirect and sendfile.
+MEDIA_READ_SIZE = 256 * 1024
+MEDIA_MAX_RANGES = 16
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+
+def parse_range_header(range_header: str, size: int) -> Optional[list]:
+    """Parse ``bytes=`` ranges into inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored (full 200 response) and an
+    empty list when no range is satisfiable (416).
+    """
+    unit, _, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                start, end = max(size - int(last), 0), size - 1
+        except ValueError:
+            return None
+        if start > end or start >= size:
+            continue
+        ranges.append((start, end))
+    return None if len(ranges) > MEDIA_MAX_RANGES else ranges
+
+class RangeFileResponse(Response):
+    """Streams byte ranges of a file; ``parts`` is a list of (prefix, start, end) with inclusive ends"""
+
+    def __init__(self, path: Path, parts: list, epilogue: bytes, status_code: int, headers: dict,
+                 media_type: str, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.parts = parts
+        self.epilogue = epilogue
+        self.send_body = send_body
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        media_file = await asyncio.to_thread(open, self.path, 'rb')
+        try:
+            for prefix, start, end in self.parts:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": media_file,
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": True,
+                    })
+                    continue
+                position = start
+                while position <= end:
+                    data = await asyncio.to_thread(
+                        os.pread, media_file.fileno(), min(MEDIA_READ_SIZE, end - position + 1), position
+                    )
+                    if not data:
+                        break
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+                    position += len(data)
+            await send({"type": "http.response.body", "body": self.epilogue, "more_body": False})
+        finally:
+            await asyncio.to_thread(media_file.close)
+
+def media_etag(stat_result: os.stat_result, sha256: Optional[str] = None) -> str:
+    if sha256:
+        return f'"{sha256[:32]}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def not_modified_since(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(request, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def media_response(request: Request, path: Path, media_type: str, sha256: Optional[str] = None) -> Response:
+    """Build a 200/206/304/416 response for a file on disk, honouring Range and If-Range"""
+    stat_result = path.stat()
+    size = stat_result.st_size
+    etag = media_etag(stat_result, sha256)
+    last_modified = datetime.utcfromtimestamp(stat_result.st_mtime)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    send_body = request.method != "HEAD"
+
+    if not_modified_since(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag or if_range == headers["Last-Modified"]):
+        ranges = parse_range_header(range_header, size)
+    if ranges is not None and not ranges:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if MEDIA_ACCEL_REDIRECT and send_body:
+        # nginx handles Range itself and sends the file with sendfile
+        relative = path.resolve().relative_to(UPLOAD_ROOT.resolve()).as_posix()
+        return Response(headers={**headers, "X-Accel-Redirect": MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + relative},
+                        media_type=media_type)
+
+    if not ranges:
+        headers["Content-Length"] = str(size)
+        return RangeFileResponse(path, [(b"", 0, size - 1)] if size else [], b"", 200, headers, media_type, send_body)
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return RangeFileResponse(path, [(b"", start, end)], b"", 206, headers, media_type, send_body)
+
+    boundary = uuid.uuid4().hex
+    parts = [
+        (
+            (f"\r\n--{boundary}\r\nContent-Type: {media_type}\r\n"
+             f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode('latin-1'),
+            start,
+            end,
+        )
+        for start, end in ranges
+    ]
+    epilogue = f"\r\n--{boundary}--\r\n".encode('latin-1')
+    headers["Content-Length"] = str(
+        sum(len(prefix) + end - start + 1 for prefix, start, end in parts) + len(epilogue)
+    )
+    return RangeFileResponse(
+        path, parts, epilogue, 206, headers, f"multipart/byteranges; boundary={boundary}", send_body
+    )
+
+def content_media_path(content: dict) -> Path:
+    """Resolve a content item's stored file, refusing anything outside uploads/"""
+    file_path = content.get("file_path") or content.get("content_data") or ""
+    if file_path.startswith(('http://', 'https://')):
+        raise HTTPException(status_code=400, detail="Content is a URL, not an uploaded file")
+    path = Path(file_path)
+    try:
+        path.resolve().relative_to(UPLOAD_ROOT.resolve())
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Content has no uploaded media")
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Media file not found")
+    return path
+
+@app.api_route("/api/media/{content_id}", methods=["GET", "HEAD"])
+async def get_media(
+    content_id: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, description="Display width; images are served from the closest larger variant"),
+    user_id: str = Depends(verify_media_token),
+):
+    """Serve an uploaded content file with Range, ETag and Last-Modified support"""
+    content = await db.content.find_one({"id": content_id}, {"_id": 0})
+    if not content:
+        raise HTTPException(status_code=404, detail="Content not found")
+    # Once a blob has variants the chosen representation depends on Accept, even
+    # when the original wins, so every such response says so for shared caches
+    has_variants = False
+    if content.get("content_type") == "image" and content.get("blob_id"):
+        blob = await db.blobs.find_one({"_id": content["blob_id"]}, {"image": 1})
+        has_variants = bool(blob and blob.get("image"))
+        variant = pick_image_variant(blob["image"], w, request.headers.get("accept", "")) if has_variants else None
+        if variant and await asyncio.to_thread(Path(variant["path"]).is_file):
+            response = await asyncio.to_thread(media_response, request, Path(variant["path"]), variant["media_type"])
+            response.headers["Vary"] = "Accept"
+            return response
+    path = await asyncio.to_thread(content_media_path, content)
+    media_type = content.get("mime_type") or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    response = await asyncio.to_thread(media_response, request, path, media_type, content.get("sha256"))
+    if has_variants:
+        response.headers["Vary"] = "Accept"
+    return response
+
+# Progress rollups
+# progress_rollups holds per-user completed-chapter counts for each subject and
+# class; chapter_totals holds the matching chapter counts. Both are maintained
+# with $inc as progress and chapters are written, so completion percentages are
+# two indexed reads. rebuild_rollups() recomputes everything from scratch.
+ROLLUP_SCOPES = ("subject", "class")
+
+async def chapter_scopes(chapter_ids: list) -> dict:
+    """Map chapter ids to their (subject_id, class_id)"""
+    chapters = await db.chapters.find(
+        {"id": {"$in": chapter_ids}}, {"_id": 0, "id": 1, "subject_id": 1}
+    ).to_list(length=None)
+    subject_ids = list({chapter["subject_id"] for chapter in chapters})
+    subjects = await db.subjects.find(
+        {"id": {"$in": subject_ids}}, {"_id": 0, "id": 1, "class_id": 1}
+    ).to_list(length=None)
+    class_of = {subject["id"]: subject.get("class_id") for subject in subjects}
+    return {chapter["id"]: (chapter["subject_id"], class_of.get(chapter["subject_id"])) for chapter in chapters}
+
+async def apply_rollup_deltas(deltas: dict):
+    """Apply (user_id, chapter_id) -> +1/-1 completion changes to progress_rollups"""
+    scopes = await chapter_scopes(list({chapter_id for _, chapter_id in deltas}))
+    increments = {}
+    for (user_id, chapter_id), delta in deltas.items():
+        if chapter_id not in scopes:
+            continue  # progress on a chapter that no longer exists
+        subject_id, class_id = scopes[chapter_id]
+        for scope_type, scope_id in (("subject", subject_id), ("class", class_id)):
+            if scope_id:
+                key = (user_id, scope_type, scope_id)
+                increments[key] = increments.get(key, 0) + delta
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "scope_type": scope_type, "scope_id": scope_id},
+            {"$inc": {"completed": delta}},
+            upsert=True,
+        )
+        for (user_id, scope_type, scope_id), delta in increments.items()
+        if delta
+    ]
+    if operations:
+        await db.progress_rollups.bulk_write(operations, ordered=False)
+
+async def increment_chapter_totals(chapter_docs: list):
+    """Count newly created chapters into their subject's and class's totals"""
+    subject_ids = list({chapter["subject_id"] for chapter in chapter_docs})
+    subjects = await db.subjects.find(
+        {"id": {"$in": subject_ids}}, {"_id": 0, "id": 1, "class_id": 1}
+    ).to_list(length=None)
+    class_of = {subject["id"]: subject.get("class_id") for subject in subjects}
+    increments = {}
+    for chapter in chapter_docs:
+        subject_id = chapter["subject_id"]
+        class_id = class_of.get(subject_id)
+        increments[("subject", subject_id, class_id)] = increments.get(("subject", subject_id, class_id), 0) + 1
+        if class_id:
+            increments[("class", class_id, None)] = increments.get(("class", class_id, None), 0) + 1
+    operations = []
+    for (scope_type, scope_id, class_id), count in increments.items():
+        update = {"$inc": {"total": count}}
+        if class_id:
+            update["$set"] = {"class_id": class_id}
+        operations.append(UpdateOne({"scope_type": scope_type, "scope_id": scope_id}, update, upsert=True))
+    await db.chapter_totals.bulk_write(operations, ordered=False)
+
+async def rebuild_rollups() -> dict:
+    """Recompute chapter_totals and progress_rollups from chapters, subjects and progress.
+
+    The new collections are built under temporary names and renamed over the
+    live ones, so readers never see a half-built rollup.
+    """
+    if progress_buffer:
+        await progress_buffer.flush()
+    # The rebuilt counts include every completed chapter, so mark all of them counted
+    if PROGRESS_STORAGE_COMPACT:
+        await db.progress_compact.update_many({}, [{"$set": {"counted": {"$ifNull": ["$completed", []]}}}])
+    else:
+        await db.progress.update_many(
+            {"$expr": {"$ne": ["$completed", "$counted"]}}, [{"$set": {"counted": "$completed"}}]
+        )
+
+    subjects = await db.subjects.find({}, {"_id": 0, "id": 1, "class_id": 1}).to_list(length=None)
+    class_of = {subject["id"]: subject.get("class_id") for subject in subjects}
+    subject_of = {}
+    async for chapter in db.chapters.find({}, {"_id": 0, "id": 1, "subject_id": 1}):
+        subject_of[chapter["id"]] = chapter["subject_id"]
+
+    totals = {}
+    for subject_id in subject_of.values():
+        totals[("subject", subject_id)] = totals.get(("subject", subject_id), 0) + 1
+        if class_of.get(subject_id):
+            totals[("class", class_of[subject_id])] = totals.get(("class", class_of[subject_id]), 0) + 1
+    total_docs = [
+        {"scope_type": scope_type, "scope_id": scope_id, "total": total,
+         **({"class_id": class_of.get(scope_id)} if scope_type == "subject" and class_of.get(scope_id) else {})}
+        for (scope_type, scope_id), total in totals.items()
+    ]
+
+    completed = {}
+    async for user_id, chapter_id in completed_chapter_pairs():
+        subject_id = subject_of.get(chapter_id)
+        if not subject_id:
+            continue
+        for scope_type, scope_id in (("subject", subject_id), ("class", class_of.get(subject_id))):
+            if scope_id:
+                completed[(user_id, scope_type, scope_id)] = completed.get((user_id, scope_type, scope_id), 0) + 1
+    rollup_docs = [
+        {"user_id": user_id, "scope_type": scope_type, "scope_id": scope_id, "completed": count}
+        for (user_id, scope_type, scope_id), count in completed.items()
+    ]
+
+    for name, docs in (("chapter_totals", total_docs), ("progress_rollups", rollup_docs)):
+        staging = db[f"{name}_rebuild"]
+        await staging.drop()
+        await staging.create_indexes(REQUIRED_INDEXES[name])
+        if docs:
+            await staging.insert_many(docs, ordered=False)
+        await staging.rename(name, dropTarget=True)
+
+    return {"chapter_totals": len(total_docs), "progress_rollups": len(rollup_docs)}
+
+# Compact progress storage
+# With PROGRESS_STORAGE=compact, progress lives in one progress_compact document
+# per user: {"_id": user_id, "completed": [ordinals], "incomplete": [ordinals],
+# "updated_at": ...}. chapter_ordinals maps chapter ids to small dense integers,
+# so a user's whole history is a few hundred ints instead of hundreds of
+# documents. The /api/progress/* API is unchanged; per-chapter updated_at is
+# reported as the user's last update time.
+PROGRESS_STORAGE_COMPACT = os.environ.get('PROGRESS_STORAGE', 'documents').lower() == 'compact'
+MIGRATION_BATCH_SIZE = 500
+PROGRESS_RECONCILE_CONCURRENCY = int(os.environ.get('PROGRESS_RECONCILE_CONCURRENCY', '16'))
+
+class ChapterOrdinals:
+    """Allocates and caches the chapter id <-> ordinal dictionary; ordinals never change once assigned"""
+
+    def __init__(self):
+        self.by_chapter = {}
+        self.by_ordinal = {}
+
+    def _remember(self, docs: list):
+        for doc in docs:
+            self.by_chapter[doc["chapter_id"]] = doc["ordinal"]
+            self.by_ordinal[doc["ordinal"]] = doc["chapter_id"]
+
+    async def _load(self, query: dict):
+        self._remember(await db.chapter_ordinals.find(query, {"_id": 0}).to_list(length=None))
+
+    async def ordinals_for(self, chapter_ids) -> dict:
+        missing = list({chapter_id for chapter_id in chapter_ids if chapter_id not in self.by_chapter})
+        if missing:
+            await self._load({"chapter_id": {"$in": missing}})
+            missing = [chapter_id for chapter_id in missing if chapter_id not in self.by_chapter]
+        if missing:
+            counter = await db.counters.find_one_and_update(
+                {"_id": "chapter_ordinal"},
+                {"$inc": {"seq": len(missing)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            first = counter["seq"] - len(missing)
+            try:
+                await db.chapter_ordinals.insert_many(
+                    [{"chapter_id": chapter_id, "ordinal": first + i} for i, chapter_id in enumerate(missing)],
+                    ordered=False,
+                )
+            except BulkWriteError:
+                pass  # another worker assigned some of these first; the unused ordinals are simply skipped
+            await self._load({"chapter_id": {"$in": missing}})
+        return {chapter_id: self.by_chapter[chapter_id] for chapter_id in chapter_ids if chapter_id in self.by_chapter}
+
+    async def chapters_for(self, ordinals) -> dict:
+        missing = [ordinal for ordinal in set(ordinals) if ordinal not in self.by_ordinal]
+        if missing:
+            await self._load({"ordinal": {"$in": missing}})
+        return {ordinal: self.by_ordinal[ordinal] for ordinal in ordinals if ordinal in self.by_ordinal}
+
+chapter_ordinals = ChapterOrdinals()
+
+async def expand_compact_progress(doc: Optional[dict]) -> list:
+    """Turn a progress_compact document back into the per-chapter progress shape"""
+    if not doc:
+        return []
+    completed = doc.get("completed", [])
+    incomplete = doc.get("incomplete", [])
+    chapters = await chapter_ordinals.chapters_for(completed + incomplete)
+    progress = [
+        {
+            "user_id": doc["_id"],
+            "chapter_id": chapters[ordinal],
+            "completed": is_completed,
+            "updated_at": doc.get("updated_at"),
+        }
+        for ordinals, is_completed in ((completed, True), (incomplete, False))
+        for ordinal in ordinals
+        if ordinal in chapters
+    ]
+    progress.sort(key=lambda entry: entry["chapter_id"])
+    return progress
+
+async def read_progress(user_id: str) -> list:
+    """All of a user's progress documents from whichever storage is active"""
+    if PROGRESS_STORAGE_COMPACT:
+        return await expand_compact_progress(await db.progress_compact.find_one({"_id": user_id}))
+    return await db.progress.find({"user_id": user_id}, {"_id": 0, "counted": 0}).to_list(length=None)
+
+def compact_progress_update(completed: list, incomplete: list, updated_at: datetime) -> list:
+    """Pipeline update moving ordinals between a user's completed and incomplete sets.
+
+    ``counted`` is left alone; on documents that predate it, it starts from the
+    old completed set, which the rollups already include (every expression in a
+    $set stage sees the document as it was before the stage).
+    """
+    return [{"$set": {
+        "counted": {"$ifNull": ["$counted", {"$ifNull": ["$completed", []]}]},
+        "completed": {"$setUnion": [{"$setDifference": [{"$ifNull": ["$completed", []]}, incomplete]}, completed]},
+        "incomplete": {"$setUnion": [{"$setDifference": [{"$ifNull": ["$incomplete", []]}, completed]}, incomplete]},
+        "updated_at": updated_at,
+    }}]
+
+async def store_progress(entries: dict):
+    """Upsert (user_id, chapter_id) -> (completed, updated_at) entries into the active storage"""
+    if not PROGRESS_STORAGE_COMPACT:
+        await db.progress.bulk_write(
+            [
+                progress_upsert(user_id, chapter_id, completed, updated_at)
+                for (user_id, chapter_id), (completed, updated_at) in entries.items()
+            ],
+            ordered=False,
+        )
+        return
+    ordinals = await chapter_ordinals.ordinals_for({chapter_id for _, chapter_id in entries})
+    per_user = {}
+    for (user_id, chapter_id), (completed, updated_at) in entries.items():
+        sets = per_user.setdefault(user_id, {"completed": [], "incomplete": [], "updated_at": updated_at})
+        sets["completed" if completed else "incomplete"].append(ordinals[chapter_id])
+        sets["updated_at"] = max(sets["updated_at"], updated_at)
+    await db.progress_compact.bulk_write(
+        [
+            UpdateOne(
+                {"_id": user_id},
+                compact_progress_update(sets["completed"], sets["incomplete"], sets["updated_at"]),
+                upsert=True,
+            )
+            for user_id, sets in per_user.items()
+        ],
+        ordered=False,
+    )
+
+async def reconcile_rollups(keys) -> dict:
+    """Roll completion changes the rollups don't include yet into progress_rollups.
+
+    Every progress document (per user in compact mode) keeps in ``counted`` the
+    completion state already counted in the rollups. Moving ``counted`` to
+    ``completed`` is one atomic update per document, and the delta is taken from
+    that update, so concurrent or repeated reconciles can't count a change twice
+    and a write whose reconcile failed is counted by the next one that covers
+    it. Only a failure between those updates and the $inc loses deltas;
+    rebuild_rollups() repairs that. Returns (user_id, chapter_id) -> +1/-1.
+    """
+    by_user = {}
+    for user_id, chapter_id in keys:
+        by_user.setdefault(user_id, []).append(chapter_id)
+    if not by_user:
+        return {}
+    limit = asyncio.Semaphore(PROGRESS_RECONCILE_CONCURRENCY)
+    deltas = {}
+
+    if PROGRESS_STORAGE_COMPACT:
+        async def settle_user(user_id: str):
+            async with limit:
+                before = await db.progress_compact.find_one_and_update(
+                    {"_id": user_id, "$expr": {"$not": {"$setEquals": [
+                        {"$ifNull": ["$completed", []]}, {"$ifNull": ["$counted", []]},
+                    ]}}},
+                    [{"$set": {"counted": {"$ifNull": ["$completed", []]}}}],
+                    projection={"completed": 1, "counted": 1},
+                    return_document=ReturnDocument.BEFORE,
+                )
+            if not before:
+                return
+            completed, counted = set(before.get("completed", [])), set(before.get("counted", []))
+            for ordinal, chapter_id in (await chapter_ordinals.chapters_for(list(completed ^ counted))).items():
+                deltas[(user_id, chapter_id)] = 1 if ordinal in completed else -1
+
+        settles = [settle_user(user_id) for user_id in by_user]
+    else:
+        uncounted = {"$expr": {"$ne": ["$completed", "$counted"]}}
+        stale = await db.progress.find(
+            {"$or": [{"user_id": user_id, "chapter_id": {"$in": chapter_ids}} for user_id, chapter_ids in by_user.items()],
+             **uncounted},
+            {"_id": 1},
+        ).to_list(length=None)
+
+        async def settle(doc_id):
+            async with limit:
+                doc = await db.progress.find_one_and_update(
+                    {"_id": doc_id, **uncounted},
+                    [{"$set": {"counted": "$completed"}}],
+                    projection={"_id": 0, "user_id": 1, "chapter_id": 1, "completed": 1},
+                    return_document=ReturnDocument.AFTER,
+                )
+            if doc:
+                deltas[(doc["user_id"], doc["chapter_id"])] = 1 if doc["completed"] else -1
+
+        settles = [settle(doc["_id"]) for doc in stale]
+
+    # Count whatever did settle even if some updates failed; the rest stay uncounted for the next reconcile
+    results = await asyncio.gather(*settles, return_exceptions=True)
+    if deltas:
+        await apply_rollup_deltas(deltas)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return deltas
+
+async def completed_chapter_pairs():
+    """Yield (user_id, chapter_id) for every completed chapter in the active storage"""
+    if PROGRESS_STORAGE_COMPACT:
+        async for doc in db.progress_compact.find({}, {"completed": 1}):
+            chapters = await chapter_ordinals.chapters_for(doc.get("completed", []))
+            for chapter_id in chapters.values():
+                yield doc["_id"], chapter_id
+        return
+    pipeline = [
+        {"$match": {"completed": True}},
+        {"$group": {"_id": {"user_id": "$user_id", "chapter_id": "$chapter_id"}}},
+    ]
+    async for row in db.progress.aggregate(pipeline, allowDiskUse=True):
+        yield row["_id"]["user_id"], row["_id"]["chapter_id"]
+
+async def migrate_progress_to_compact() -> dict:
+    """Copy the per-chapter progress collection into progress_compact.
+
+    Run it before switching PROGRESS_STORAGE to compact; it is idempotent and
+    leaves db.progress in place so the switch can be rolled back.
+    """
+    if progress_buffer:
+        await progress_buffer.flush()
+
+    users = rows = 0
+    operations = []
+
+    async def compact_user(user_id: str, user_rows: list):
+        ordinals = await chapter_ordinals.ordinals_for([row["chapter_id"] for row in user_rows])
+        timestamps = [row["updated_at"] for row in user_rows if row.get("updated_at")]
+        operations.append(ReplaceOne(
+            {"_id": user_id},
+            {
+                "completed": sorted(ordinals[row["chapter_id"]] for row in user_rows if row.get("completed")),
+                "incomplete": sorted(ordinals[row["chapter_id"]] for row in user_rows if not row.get("completed")),
+                # Documents that predate counted were included in the rollups when completed
+                "counted": sorted(
+                    ordinals[row["chapter_id"]] for row in user_rows if row.get("counted", row.get("completed"))
+                ),
+                "updated_at": max(timestamps) if timestamps else datetime.utcnow(),
+            },
+            upsert=True,
+        ))
+        if len(operations) >= MIGRATION_BATCH_SIZE:
+            await db.progress_compact.bulk_write(operations, ordered=False)
+            operations.clear()
+
+    current_user, user_rows = None, []
+    cursor = db.progress.find({}, {"_id": 0}).sort([("user_id", ASCENDING), ("chapter_id", ASCENDING)])
+    async for row in cursor:
+        if row["user_id"] != current_user and user_rows:
+            await compact_user(current_user, user_rows)
+            users += 1
+            user_rows = []
+        current_user = row["user_id"]
+        user_rows.append(row)
+        rows += 1
+    if user_rows:
+        await compact_user(current_user, user_rows)
+        users += 1
+    if operations:
+        await db.progress_compact.bulk_write(operations, ordered=False)
+    return {"users": users, "progress_rows": rows}
+
+# Progress write-behind
+class ProgressWriteBuffer:
+    """Coalesces progress upserts in memory and flushes them as one bulk_write.
+
+    Only the last value per (user_id, chapter_id) is kept. Every update is
+    appended and fsynced to a local journal before it is acknowledged, and the
+    journal is compacted to the still-pending entries after each successful
+    flush, so a crash loses nothing: the journal is replayed at startup.
+    """
+
+    def __init__(self, journal_path: str, flush_interval: float, max_pending: int):
+        self.journal_path = Path(journal_path)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = {}  # (user_id, chapter_id) -> (completed, updated_at)
+        self.inflight = {}  # the batch a flush is writing; still visible to readers until it lands
+        self.journal_lock = asyncio.Lock()
+        self.flush_lock = asyncio.Lock()
+        self.flush_loop_task = None
+        self.size_flush_task = None
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_writes = 0
+        self.failed_flushes = 0
+
+    def _append_journal(self, lines: list):
+        with open(self.journal_path, 'a', encoding='utf-8') as journal:
+            journal.writelines(lines)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _rewrite_journal(self, pending: dict):
+        tmp_path = self.journal_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as journal:
+            journal.writelines(
+                journal_line(user_id, chapter_id, completed, updated_at)
+                for (user_id, chapter_id), (completed, updated_at) in pending.items()
+            )
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def replay(self) -> int:
+        """Load entries journaled before a crash or restart back into the buffer"""
+        if not self.journal_path.exists():
+            return 0
+        replayed = 0
+        with open(self.journal_path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                    key = (entry["user_id"], entry["chapter_id"])
+                    self.pending[key] = (entry["completed"], datetime.fromisoformat(entry["updated_at"]))
+                    replayed += 1
+                except (ValueError, KeyError):
+                    continue  # torn final line from a crash mid-append
+        return replayed
+
+    async def add(self, user_id: str, updates: dict, updated_at: datetime):
+        lines = [journal_line(user_id, chapter_id, completed, updated_at) for chapter_id, completed in updates.items()]
+        async with self.journal_lock:
+            await asyncio.to_thread(self._append_journal, lines)
+            for chapter_id, completed in updates.items():
+                key = (user_id, chapter_id)
+                if key in self.pending:
+                    self.coalesced += 1
+                self.pending[key] = (completed, updated_at)
+        if len(self.pending) >= self.max_pending and not (self.size_flush_task and not self.size_flush_task.done()):
+            self.size_flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        async with self.flush_lock:
+            async with self.journal_lock:
+                batch, self.pending = self.pending, {}
+                self.inflight = batch
+            if not batch:
+                return
+            written = False
+            try:
+                await write_progress(batch)
+                written = True
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error("Progress flush of %d entries failed, will retry: %s", len(batch), e)
+            finally:
+                # Until the write is confirmed the batch goes back to pending, whatever
+                # interrupted it, so the next journal rewrite can't drop it
+                if not written:
+                    async with self.journal_lock:
+                        for key, value in batch.items():
+                            self.pending.setdefault(key, value)  # keep anything newer that arrived meanwhile
+                        self.inflight = {}
+            if not written:
+                return
+            async with self.journal_lock:
+                self.inflight = {}
+                await asyncio.to_thread(self._rewrite_journal, dict(self.pending))
+            self.flushes += 1
+            self.flushed_writes += len(batch)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Progress flush loop error: %s", e)
+
+    def has_pending(self, user_id: str) -> bool:
+        return any(key[0] == user_id for key in (*self.inflight, *self.pending))
+
+    def merge(self, user_id: str, docs: list) -> list:
+        """Overlay a user's in-flight and pending entries onto progress documents read from Mongo"""
+        merged = {doc["chapter_id"]: doc for doc in docs}
+        # Pending entries are newer than in-flight ones, so they are applied last
+        for (pending_user, chapter_id), (completed, updated_at) in [*self.inflight.items(), *self.pending.items()]:
+            if pending_user == user_id:
+                merged[chapter_id] = {
+                    "user_id": user_id,
+                    "chapter_id": chapter_id,
+                    "completed": completed,
+                    "updated_at": updated_at,
+                }
+        return list(merged.values())
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "inflight": len(self.inflight),
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed_writes": self.flushed_writes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+def journal_line(user_id: str, chapter_id: str, completed: bool, updated_at: datetime) -> str:
+    return json.dumps({
+        "user_id": user_id,
+        "chapter_id": chapter_id,
+        "completed": completed,
+        "updated_at": updated_at.isoformat(),
+    }) + "\n"
+
+progress_buffer = (
+    ProgressWriteBuffer(
+        journal_path=os.environ.get('PROGRESS_JOURNAL_PATH', 'progress_journal.jsonl'),
+        flush_interval=float(os.environ.get('PROGRESS_FLUSH_INTERVAL', '1.0')),
+        max_pending=int(os.environ.get('PROGRESS_FLUSH_MAX_PENDING', '500')),
+    )
+    if os.environ.get('PROGRESS_WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+    else None
+)
+
+@app.on_event("startup")
+async def start_progress_buffer():
+    if not progress_buffer:
+        return
+    replayed = progress_buffer.replay()
+    if replayed:
+        logger.info("Replaying %d journaled progress updates", replayed)
+        await progress_buffer.flush()
+    progress_buffer.flush_loop_task = asyncio.create_task(progress_buffer.run())
+
+@app.on_event("shutdown")
+async def stop_progress_buffer():
+    if not progress_buffer:
+        return
+    if progress_buffer.flush_loop_task:
+        progress_buffer.flush_loop_task.cancel()
+    await progress_buffer.flush()
+
 # Progress tracking endpoints
+def progress_upsert(user_id: str, chapter_id: str, completed: bool, updated_at: datetime) -> UpdateOne:
+    # The filter fields are copied into new documents. counted is left alone; on
+    # documents that predate it, it starts from the old completed value, which the
+    # rollups already include, and on new ones from false.
+    return UpdateOne(
+        {"user_id": user_id, "chapter_id": chapter_id},
+        [{"$set": {
+            "completed": completed,
+            "updated_at": updated_at,
+            "counted": {"$ifNull": ["$counted", {"$ifNull": ["$completed", False]}]},
+        }}],
+        upsert=True,
+    )
+
+async def apply_progress_updates(user_id: str, updates: List[ProgressUpdate]):
+    """Upsert a user's chapter progress in one bulk_write; the last update per chapter wins"""
+    latest = {update.chapter_id: update.completed for update in updates}
+    if not latest:
+        return
+    now = datetime.utcnow()
+    if progress_buffer:
+        await progress_buffer.add(user_id, latest, now)
+        return
+    await write_progress({(user_id, chapter_id): (completed, now) for chapter_id, completed in latest.items()})
+
+async def write_progress(entries: dict):
+    """Upsert (user_id, chapter_id) -> (completed, updated_at) entries and roll the
+    completion changes up into progress_rollups.
+
+    Rollups are reconciled even when the write partly failed, so the entries that
+    did land are counted now rather than whenever they are next written.
+    """
+    try:
+        await store_progress(entries)
+    finally:
+        await reconcile_rollups(entries)
+
 @app.post("/api/progress/update")
 async def update_progress(progress_data: ProgressUpdate, user_id: str = Depends(verify_token)):
-    progress_doc = {
-        "user_id": user_id,
-        "chapter_id": progress_data.chapter_id,
-        "completed": progress_data.completed,
-        "updated_at": datetime.utcnow()
-    }
-    
     # Update or insert progress
-    db.progress.update_one(
-        {"user_id": user_id, "chapter_id": progress_data.chapter_id},
-        {"$set": progress_doc},
-        upsert=True
-    )
+    await apply_progress_updates(user_id, [progress_data])
     
     return {"message": "Progress updated successfully"}
 
+@app.post("/api/progress/batch")
+async def update_progress_batch(batch: ProgressBatch, user_id: str = Depends(verify_token)):
+    """Apply many chapter updates at once and return the user's progress snapshot"""
+    if len(batch.updates) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} updates per request")
+    await apply_progress_updates(user_id, batch.updates)
+    progress = await read_progress(user_id)
+    if progress_buffer:
+        progress = progress_buffer.merge(user_id, progress)
+    return {"message": "Progress updated successfully", "progress": progress}
+
 @app.get("/api/progress/{user_id}")
-async def get_progress(user_id: str, current_user_id: str = Depends(verify_token)):
-    progress = list(db.progress.find({"user_id": user_id}, {"_id": 0}))
+async def get_progress(user_id: str, request: Request, response: Response, params: ListParams = Depends(), current_user_id: str = Depends(verify_token)):
+    if PROGRESS_STORAGE_COMPACT:
+        progress = await read_progress(user_id)
+        if progress_buffer:
+            progress = progress_buffer.merge(user_id, progress)
+        return list_from_memory(progress, params, PROGRESS_SORT_KEYS, request, response)
+    if progress_buffer and progress_buffer.has_pending(user_id):
+        if params.paginated or params.fields or wants_ndjson(request):
+            # Pages, projections and streams are read straight from Mongo, so write pending entries first
+            await progress_buffer.flush()
+        else:
+            progress = await fetch_list(db.progress, {"user_id": user_id}, params, PROGRESS_SORT_KEYS, request, response,
+                                          hidden=PROGRESS_HIDDEN_FIELDS)
+            return progress_buffer.merge(user_id, progress)
+    progress = await fetch_list(db.progress, {"user_id": user_id}, params, PROGRESS_SORT_KEYS, request, response,
+                                          hidden=PROGRESS_HIDDEN_FIELDS)
     return progress
 
+@app.get("/api/progress/{user_id}/rollup")
+async def get_progress_rollup(user_id: str, class_id: Optional[str] = None, current_user_id: str = Depends(verify_token)):
+    """Per-subject and per-class completion for a user, read from the maintained rollups"""
+    if progress_buffer and progress_buffer.has_pending(user_id):
+        # flush() takes flush_lock, so this also waits out a flush already writing this user's entries
+        await progress_buffer.flush()
+    totals_filter = {}
+    if class_id:
+        totals_filter = {"$or": [
+            {"scope_type": "class", "scope_id": class_id},
+            {"scope_type": "subject", "class_id": class_id},
+        ]}
+    totals = await db.chapter_totals.find(totals_filter, {"_id": 0}).to_list(length=None)
+    rollups = await db.progress_rollups.find({"user_id": user_id}, {"_id": 0}).to_list(length=None)
+    completed = {(rollup["scope_type"], rollup["scope_id"]): rollup["completed"] for rollup in rollups}
+
+    result = {"subjects": [], "classes": []}
+    for total in totals:
+        done = max(0, completed.get((total["scope_type"], total["scope_id"]), 0))
+        entry = {
+            f"{total['scope_type']}_id": total["scope_id"],
+            "completed": done,
+            "total": total["total"],
+            "percent": round(100.0 * done / total["total"], 1) if total["total"] else 0.0,
+        }
+        if total["scope_type"] == "subject":
+            entry["class_id"] = total.get("class_id")
+            result["subjects"].append(entry)
+        else:
+            result["classes"].append(entry)
+    return result
+
+# Background jobs
+# Heavy work runs off the request path through a Mongo-backed queue. Each job
+# type declares its executor ("async", "thread" or "process"), a concurrency
+# limit, and a retry budget with exponential backoff. Running jobs hold a lease
+# that a heartbeat renews; jobs whose lease lapsed (e.g. the server restarted)
+# are put back in the queue at startup and on every poll.
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1.0'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+JOB_THREAD_WORKERS = int(os.environ.get('JOB_THREAD_WORKERS', '4'))
+JOB_PROCESS_WORKERS = int(os.environ.get('JOB_PROCESS_WORKERS', str(os.cpu_count() or 2)))
+
+class JobType:
+    def __init__(self, name: str, func, executor: str, concurrency: int, max_attempts: int, backoff: float, on_success):
+        self.name = name
+        self.func = func
+        self.executor = executor
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.on_success = on_success
+
+JOB_TYPES = {}
+
+def job_type(name: str, executor: str = "thread", concurrency: int = 1, max_attempts: int = 3,
+             backoff: float = 5.0, on_success=None):
+    """Register a job handler.
+
+    ``thread`` and ``process`` handlers are plain functions taking the payload
+    dict and returning a BSON-serialisable result (process handlers must be
+    module-level so they can be pickled); ``async`` handlers are coroutines.
+    ``on_success(payload, result)`` runs on the event loop afterwards, which is
+    where results are written back to Mongo.
+    """
+    def register(func):
+        JOB_TYPES[name] = JobType(name, func, executor, concurrency, max_attempts, backoff, on_success)
+        return func
+    return register
+
+class JobQueue:
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.thread_pool = None
+        self.process_pool = None
+        self.running = {}  # job type -> jobs in flight
+        self.tasks = set()
+        self.wakeup = asyncio.Event()
+        self.loop_task = None
+
+    async def enqueue(self, job_type_name: str, payload: dict, delay: float = 0) -> str:
+        if job_type_name not in JOB_TYPES:
+            raise ValueError(f"Unknown job type: {job_type_name}")
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        await db.jobs.insert_one({
+            "_id": job_id,
+            "type": job_type_name,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "run_after": now + timedelta(seconds=delay),
+            "created_at": now,
+            "updated_at": now,
+        })
+        self.wakeup.set()
+        return job_id
+
+    async def requeue_expired(self) -> int:
+        """Return jobs whose worker stopped renewing its lease to the queue"""
+        result = await db.jobs.update_many(
+            {"status": "running", "lease_until": {"$lt": datetime.utcnow()}},
+            {"$set": {"status": "queued", "run_after": datetime.utcnow(), "updated_at": datetime.utcnow()},
+             "$unset": {"worker_id": ""}},
+        )
+        return result.modified_count
+
+    async def claim(self, spec: JobType) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await db.jobs.find_one_and_update(
+            {"status": "queued", "type": spec.name, "run_after": {"$lte": now}},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": self.worker_id,
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_after", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def executor_for(self, spec: JobType):
+        if spec.executor == "process":
+            if self.process_pool is None:
+                # spawn, not fork: the server process already runs threads
+                self.process_pool = ProcessPoolExecutor(
+                    max_workers=JOB_PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self.process_pool
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPoolExecutor(max_workers=JOB_THREAD_WORKERS, thread_name_prefix="jobs")
+        return self.thread_pool
+
+    async def run(self):
+        await self.requeue_expired()
+        while True:
+            try:
+                await self.requeue_expired()
+                for spec in JOB_TYPES.values():
+                    while self.running.get(spec.name, 0) < spec.concurrency:
+                        job = await self.claim(spec)
+                        if not job:
+                            break
+                        self.running[spec.name] = self.running.get(spec.name, 0) + 1
+                        task = asyncio.create_task(self.execute(spec, job))
+                        self.tasks.add(task)
+                        task.add_done_callback(self.tasks.discard)
+            except PyMongoError as e:
+                logger.error("Job queue poll failed: %s", e)
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await db.jobs.update_one(
+                    {"_id": job_id, "worker_id": self.worker_id},
+                    {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}},
+                )
+            except PyMongoError as e:
+                # Keep renewing; the lease still has two beats of slack before it can be reclaimed
+                logger.warning("Heartbeat for job %s failed: %s", job_id, e)
+
+    async def execute(self, spec: JobType, job: dict):
+        heartbeat = asyncio.create_task(self.heartbeat(job["_id"]))
+        owned = {"_id": job["_id"], "worker_id": self.worker_id}
+        try:
+            if spec.executor == "async":
+                result = await spec.func(job["payload"])
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor_for(spec), spec.func, job["payload"]
+                )
+            if spec.on_success:
+                await spec.on_success(job["payload"], result)
+        except Exception as e:
+            now = datetime.utcnow()
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] < spec.max_attempts:
+                delay = spec.backoff * 2 ** (job["attempts"] - 1)
+                update = {"status": "queued", "run_after": now + timedelta(seconds=delay)}
+            else:
+                update = {"status": "failed", "finished_at": now}
+                logger.error("Job %s (%s) failed after %d attempts: %s", job["_id"], spec.name, job["attempts"], error)
+            await db.jobs.update_one(owned, {"$set": {**update, "last_error": error, "updated_at": now}})
+        else:
+            now = datetime.utcnow()
+            await db.jobs.update_one(
+                owned,
+                {"$set": {"status": "succeeded", "result": result, "finished_at": now, "updated_at": now}},
+            )
+        finally:
+            heartbeat.cancel()
+            self.running[spec.name] -= 1
+            self.wakeup.set()
+
+    def start(self):
+        self.loop_task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.loop_task:
+            self.loop_task.cancel()
+        for task in list(self.tasks):
+            task.cancel()
+        if self.thread_pool:
+            self.thread_pool.shutdown(wait=False, cancel_futures=True)
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False, cancel_futures=True)
+
+job_queue = JobQueue()
+
+@app.on_event("startup")
+async def start_job_queue():
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    # Jobs cut short here keep their lease and are re-queued once it lapses
+    await job_queue.stop()
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = Depends(verify_token)):
+    job = await db.jobs.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["id"] = job.pop("_id")
+    return job
+
+# Media metadata extraction
+MEDIA_PROBE_TYPES = ("video", "audio")
+FFPROBE = shutil.which("ffprobe")  # metadata extraction is skipped without it
+
+async def store_media_metadata(payload: dict, result: dict):
+    await db.blobs.update_one({"_id": payload["blob_id"]}, {"$set": {"media_info": result}})
+    chapter_ids = await db.content.distinct("chapter_id", {"blob_id": payload["blob_id"]})
+    await db.content.update_many({"blob_id": payload["blob_id"]}, {"$set": {"media_info": result}})
+    if chapter_ids:
+        await bump_versions(*(version_scope("content", chapter_id) for chapter_id in chapter_ids))
+
+@job_type("extract_media_metadata", executor="thread", concurrency=2, max_attempts=2, on_success=store_media_metadata)
+def extract_media_metadata(payload: dict) -> dict:
+    """Read duration, format and stream details of a stored media file with ffprobe"""
+    completed = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", payload["path"]],
+        capture_output=True,
+        timeout=120,
+        check=True,
+    )
+    probe = json.loads(completed.stdout or b"{}")
+    media_format = probe.get("format", {})
+    return {
+        "duration": float(media_format["duration"]) if media_format.get("duration") else None,
+        "format_name": media_format.get("format_name"),
+        "bit_rate": int(media_format["bit_rate"]) if media_format.get("bit_rate") else None,
+        "streams": [
+            {key: stream.get(key) for key in ("codec_type", "codec_name", "width", "height") if stream.get(key)}
+            for stream in probe.get("streams", [])
+        ],
+    }
+
+# Image derivatives
+# Uploaded images get downscaled copies at a thumbnail width and a few display
+# widths, each as JPEG (PNG when the image has transparency) and WebP, written
+# next to the original as <sha256>.w<width>.<ext>. Originals that browsers
+# handle poorly (BMP, TIFF scans) also get a full-width web copy. The variant
+# list is stored on the blob; /api/media picks one from ?w= and Accept.
+IMAGE_THUMBNAIL_WIDTH = int(os.environ.get('IMAGE_THUMBNAIL_WIDTH', '160'))
+IMAGE_VARIANT_WIDTHS = sorted({
+    IMAGE_THUMBNAIL_WIDTH,
+    *(int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '480,960,1600').split(',') if width.strip()),
+})
+IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', '80'))
+WEB_IMAGE_FORMATS = {"JPEG", "PNG", "GIF", "WEBP"}
+IMAGE_MEDIA_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+def save_image_variant(image, path: Path, image_format: str):
+    if image_format == "PNG":
+        options = {"optimize": True}
+    elif image_format == "WEBP":
+        options = {"quality": IMAGE_VARIANT_QUALITY, "method": 4}
+    else:
+        options = {"quality": IMAGE_VARIANT_QUALITY, "optimize": True, "progressive": True}
+    part = path.with_name(path.name + ".part")
+    image.save(part, image_format, **options)
+    os.replace(part, path)
+
+async def store_image_derivatives(payload: dict, result: dict):
+    await db.blobs.update_one({"_id": payload["blob_id"]}, {"$set": {"image": result}})
+
+@job_type("image_derivatives", executor="process", concurrency=JOB_PROCESS_WORKERS, max_attempts=2,
+          on_success=store_image_derivatives)
+def build_image_derivatives(payload: dict) -> dict:
+    """Write resized JPEG/PNG and WebP copies of an image; files already on disk are reused"""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+    source = Path(payload["path"])
+    with Image.open(source) as original:
+        source_format = original.format
+        if getattr(original, "is_animated", False):
+            return {"width": original.width, "height": original.height, "variants": []}
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else ("L" if image.mode == "L" else "RGB"))
+    fallback_format = "PNG" if has_alpha else "JPEG"
+
+    widths = [width for width in IMAGE_VARIANT_WIDTHS if width < image.width]
+    if source_format not in WEB_IMAGE_FORMATS:
+        widths.append(image.width)
+    variants = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        for image_format in (fallback_format, "WEBP"):
+            extension = ".jpg" if image_format == "JPEG" else f".{image_format.lower()}"
+            path = source.with_name(f"{source.stem}.w{width}{extension}")
+            if not path.exists():
+                save_image_variant(resized, path, image_format)
+            variants.append({
+                "width": width,
+                "height": height,
+                "media_type": IMAGE_MEDIA_TYPES[image_format],
+                "path": path.as_posix(),
+                "size": path.stat().st_size,
+            })
+    return {"width": image.width, "height": image.height, "variants": variants}
+
+def pick_image_variant(image_info: dict, width: Optional[int], accept: str) -> Optional[dict]:
+    """Smallest variant at least ``width`` wide (WebP if accepted); None means serve the original"""
+    target = min(width or image_info["width"], image_info["width"])
+    candidates = [variant for variant in image_info.get("variants", []) if variant["width"] >= target]
+    if not candidates:
+        return None
+    best_width = min(variant["width"] for variant in candidates)
+    candidates = [variant for variant in candidates if variant["width"] == best_width]
+    webp = "image/webp" in accept
+    candidates.sort(key=lambda variant: (variant["media_type"] == "image/webp") != webp)
+    return candidates[0]
+
+async def enqueue_ingest_jobs(content_doc: dict):
+    """Queue post-upload processing for a newly stored file"""
+    payload = {"blob_id": content_doc["blob_id"], "path": content_doc["file_path"]}
+    if content_doc["content_type"] in MEDIA_PROBE_TYPES and FFPROBE is not None:
+        await job_queue.enqueue("extract_media_metadata", payload)
+    elif content_doc["content_type"] == "image" and Image is not None:
+        await job_queue.enqueue("image_derivatives", payload)
+
+# LAN share indexer
+# A mounted share laid out as <class>/<subject>/<chapter>/<files> is imported as
+# content, creating classes, subjects and chapters named after the folders.
+# Directories are scanned concurrently on a thread pool, and a manifest of
+# (size, mtime) per file means a rescan only writes what was added, changed or
+# removed. Files in sub-folders of a chapter belong to that chapter; files above
+# chapter level are skipped.
+LAN_SHARE_ROOTS = [Path(root) for root in os.environ.get('LAN_SHARE_ROOTS', '').split(os.pathsep) if root]
+LAN_INDEX_WORKERS = int(os.environ.get('LAN_INDEX_WORKERS', '16'))
+LAN_INDEX_BATCH_SIZE = int(os.environ.get('LAN_INDEX_BATCH_SIZE', '1000'))
+SHARE_PARENT_FIELDS = {"classes": None, "subjects": "class_id", "chapters": "subject_id"}
+
+def scan_directory(directory: str):
+    """List one directory: ([(path, size, mtime_ns)], [subdirectory paths])"""
+    files, subdirs = [], []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat_result = entry.stat(follow_symlinks=False)
+                        files.append((entry.path, stat_result.st_size, stat_result.st_mtime_ns))
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning("Cannot scan %s: %s", directory, e)
+    return files, subdirs
+
+def scan_share(root: Path) -> dict:
+    """Walk ``root`` on LAN_INDEX_WORKERS threads; returns relative path -> (size, mtime_ns)"""
+    found = {}
+    with ThreadPoolExecutor(max_workers=LAN_INDEX_WORKERS, thread_name_prefix="share-scan") as pool:
+        pending = {pool.submit(scan_directory, str(root))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                for path, size, mtime_ns in files:
+                    found[Path(path).relative_to(root).as_posix()] = (size, mtime_ns)
+                pending.update(pool.submit(scan_directory, subdir) for subdir in subdirs)
+    return found
+
+class ShareCatalog:
+    """Find or create the class, subject and chapter named by a file's folders"""
+
+    def __init__(self, share_name: str, user_id: str):
+        self.description = f"Imported from {share_name}"
+        self.user_id = user_id
+        self.ids = {}  # (collection, parent_id, name) -> id
+        self.new_chapters = []
+        self.scopes = set()
+
+    async def chapter_id(self, class_name: str, subject_name: str, chapter_name: str) -> str:
+        class_id = await self.find_or_create("classes", None, class_name)
+        subject_id = await self.find_or_create("subjects", class_id, subject_name)
+        return await self.find_or_create("chapters", subject_id, chapter_name)
+
+    async def find_or_create(self, collection: str, parent_id: Optional[str], name: str) -> str:
+        key = (collection, parent_id, name)
+        if key in self.ids:
+            return self.ids[key]
+        parent_field = SHARE_PARENT_FIELDS[collection]
+        query = {"name": name, parent_field: parent_id} if parent_field else {"name": name}
+        existing = await db[collection].find_one(query, {"_id": 0, "id": 1})
+        if existing:
+            self.ids[key] = existing["id"]
+            return existing["id"]
+
+        if collection == "classes":
+            grade = re.search(r'\d+', name)
+            doc = new_class_doc(ClassCreate(name=name, description=self.description, grade=grade.group() if grade else name), self.user_id)
+        elif collection == "subjects":
+            doc = new_subject_doc(SubjectCreate(name=name, description=self.description, class_id=parent_id), self.user_id)
+        else:
+            doc = new_chapter_doc(ChapterCreate(name=name, description=self.description, subject_id=parent_id), self.user_id)
+            self.new_chapters.append(doc)
+        await db[collection].insert_one(doc)
+        self.scopes.add(version_scope(collection, parent_id))
+        self.ids[key] = doc["id"]
+        return doc["id"]
+
+async def bulk_write_batches(collection, operations: list):
+    for start in range(0, len(operations), LAN_INDEX_BATCH_SIZE):
+        await collection.bulk_write(operations[start:start + LAN_INDEX_BATCH_SIZE], ordered=False)
+
+@job_type("index_share", executor="async", concurrency=1, max_attempts=2, backoff=60.0)
+async def index_share(payload: dict) -> dict:
+    """Import new and changed files under a share root and drop content for removed ones"""
+    started = time.perf_counter()
+    root = Path(payload["root"])
+    if not await asyncio.to_thread(root.is_dir):
+        raise FileNotFoundError(f"Share root not found: {root}")
+    found = await asyncio.to_thread(scan_share, root)
+
+    root_key = root.as_posix()
+    manifest = {
+        entry["path"]: (entry["size"], entry["mtime_ns"])
+        async for entry in db.share_manifest.find({"root": root_key}, {"_id": 0, "path": 1, "size": 1, "mtime_ns": 1})
+    }
+    changed = [path for path, stat in found.items() if manifest.get(path) != stat]
+    removed = [path for path in manifest if path not in found]
+
+    catalog = ShareCatalog(root.name, payload["user_id"])
+    content_ops, manifest_ops, chapter_ids = [], [], set()
+    added = skipped = 0
+    now = datetime.utcnow()
+    for relative in changed:
+        size, mtime_ns = found[relative]
+        manifest_ops.append(UpdateOne(
+            {"root": root_key, "path": relative}, {"$set": {"size": size, "mtime_ns": mtime_ns}}, upsert=True
+        ))
+        parts = relative.split("/")
+        if len(parts) < 4:
+            skipped += 1
+            continue
+        chapter_id = await catalog.chapter_id(*parts[:3])
+        chapter_ids.add(chapter_id)
+        added += relative not in manifest
+        content_ops.append(UpdateOne(
+            {"share_root": root_key, "file_path": str(root / relative)},
+            {
+                "$set": {"file_size": size, "file_modified_at": datetime.utcfromtimestamp(mtime_ns / 1e9), "updated_at": now},
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "title": " / ".join(parts[3:-1] + [Path(parts[-1]).stem]),
+                    "content_type": get_file_type(parts[-1]),
+                    "description": "",
+                    "chapter_id": chapter_id,
+                    "filename": parts[-1],
+                    "created_by": payload["user_id"],
+                    "created_at": now,
+                },
+            },
+            upsert=True,
+        ))
+
+    # Content is written before the manifest, so an interrupted run is redone on the next scan
+    await bulk_write_batches(db.content, content_ops)
+    for start in range(0, len(removed), LAN_INDEX_BATCH_SIZE):
+        file_paths = [str(root / relative) for relative in removed[start:start + LAN_INDEX_BATCH_SIZE]]
+        query = {"share_root": root_key, "file_path": {"$in": file_paths}}
+        chapter_ids.update(await db.content.distinct("chapter_id", query))
+        await db.content.delete_many(query)
+        await db.share_manifest.delete_many({"root": root_key, "path": {"$in": removed[start:start + LAN_INDEX_BATCH_SIZE]}})
+    await bulk_write_batches(db.share_manifest, manifest_ops)
+
+    if catalog.new_chapters:
+        await increment_chapter_totals(catalog.new_chapters)
+    scopes = catalog.scopes | {version_scope("content", chapter_id) for chapter_id in chapter_ids}
+    if scopes:
+        await bump_versions(*scopes)
+    return {
+        "root": root_key,
+        "files": len(found),
+        "added": added,
+        "updated": len(changed) - added - skipped,
+        "removed": len(removed),
+        "skipped": skipped,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+# Content health checks
+# Every content file_path is re-validated in the background: URLs with HEAD
+# requests over pooled keep-alive connections, server-visible paths with stat()
+# on a small thread pool. The result is stored as content.health. Healthy items
+# are re-checked at doubling intervals up to HEALTH_CHECK_MAX_INTERVAL; broken
+# ones every HEALTH_CHECK_INTERVAL.
+HEALTH_CHECK_ENABLED = os.environ.get('HEALTH_CHECK_ENABLED', '1') == '1'
+HEALTH_CHECK_INTERVAL = int(os.environ.get('HEALTH_CHECK_INTERVAL', '3600'))
+HEALTH_CHECK_MAX_INTERVAL = int(os.environ.get('HEALTH_CHECK_MAX_INTERVAL', str(7 * 24 * 3600)))
+HEALTH_CHECK_POLL_INTERVAL = int(os.environ.get('HEALTH_CHECK_POLL_INTERVAL', '60'))
+HEALTH_CHECK_CONCURRENCY = int(os.environ.get('HEALTH_CHECK_CONCURRENCY', '32'))
+HEALTH_CHECK_PER_HOST = int(os.environ.get('HEALTH_CHECK_PER_HOST', '4'))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get('HEALTH_CHECK_TIMEOUT', '10'))
+HEALTH_CHECK_STAT_WORKERS = int(os.environ.get('HEALTH_CHECK_STAT_WORKERS', '8'))
+HEALTH_CHECK_BATCH_SIZE = int(os.environ.get('HEALTH_CHECK_BATCH_SIZE', '500'))
+WINDOWS_PATH_PATTERN = re.compile(r'^([A-Za-z]:[\\/]|\\\\)')
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+class HeadClient:
+    """HTTP/1.1 HEAD requests over asyncio streams, keeping idle connections per host"""
+
+    def __init__(self, per_host: int = HEALTH_CHECK_PER_HOST, timeout: float = HEALTH_CHECK_TIMEOUT):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.idle = {}  # (scheme, host, port) -> [(reader, writer)]
+        self.host_slots = {}
+        self.ssl_context = ssl.create_default_context()
+
+    async def head(self, url: str, max_redirects: int = 5) -> Tuple[int, dict, str]:
+        """Return (status, headers, final_url), following redirects"""
+        for _ in range(max_redirects + 1):
+            status, headers = await asyncio.wait_for(self.request("HEAD", url), self.timeout)
+            if status in (405, 501):
+                # Some servers refuse HEAD; ask for a single byte instead
+                status, headers = await asyncio.wait_for(self.request("GET", url), self.timeout)
+            if status not in REDIRECT_STATUSES or not headers.get("location"):
+                break
+            url = urljoin(url, headers["location"])
+        return status, headers, url
+
+    async def request(self, method: str, url: str) -> Tuple[int, dict]:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported URL: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {parts.netloc.rpartition('@')[2]}",
+            "User-Agent: elearning-link-checker",
+            "Accept: */*",
+        ]
+        if method == "GET":
+            lines += ["Range: bytes=0-0", "Connection: close"]
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+        slot = self.host_slots.setdefault(key, asyncio.Semaphore(self.per_host))
+        async with slot:
+            idle = self.idle.setdefault(key, [])
+            while idle:
+                reader, writer = idle.pop()
+                try:
+                    return await self.exchange(key, reader, writer, payload, method)
+                except (ConnectionError, EOFError):
+                    writer.close()  # the server dropped the idle connection; try the next one
+            reader, writer = await asyncio.open_connection(
+                parts.hostname, port, ssl=self.ssl_context if parts.scheme == "https" else None
+            )
+            try:
+                return await self.exchange(key, reader, writer, payload, method)
+            except BaseException:
+                writer.close()
+                raise
+
+    async def exchange(self, key, reader, writer, payload: bytes, method: str) -> Tuple[int, dict]:
+        writer.write(payload)
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        version, status = status_line.decode("latin-1").split()[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        # A HEAD response has no body, so the connection is immediately reusable
+        if method == "HEAD" and version == "HTTP/1.1" and headers.get("connection", "").lower() != "close":
+            self.idle[key].append((reader, writer))
+        else:
+            writer.close()
+        return int(status), headers
+
+    def close(self):
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+def stat_path(file_path: str) -> dict:
+    try:
+        stat_result = os.stat(file_path)
+    except FileNotFoundError:
+        return {"status": "broken", "error": "File not found"}
+    except OSError as e:
+        return {"status": "broken", "error": f"{type(e).__name__}: {e}"}
+    return {"status": "ok", "size": stat_result.st_size}
+
+class ContentHealthChecker:
+    def __init__(self):
+        self.http = None
+        self.stat_pool = None
+        self.limit = asyncio.Semaphore(HEALTH_CHECK_CONCURRENCY)
+        self.lock = asyncio.Lock()
+
+    async def probe(self, file_path: str) -> dict:
+        if file_path.startswith(('http://', 'https://')):
+            try:
+                status, headers, final_url = await self.http.head(file_path)
+            except (OSError, EOFError, ValueError, asyncio.TimeoutError) as e:
+                return {"status": "broken", "error": f"{type(e).__name__}: {e}".rstrip(": ")}
+            result = {"status": "ok" if status < 400 else "broken", "http_status": status}
+            total = headers.get("content-range", "").rpartition("/")[2] or headers.get("content-length", "")
+            if total.isdigit():
+                result["size"] = int(total)
+            if final_url != file_path:
+                result["final_url"] = final_url
+            return result
+        if not ('\\' in file_path or '/' in file_path or '.' in file_path):
+            return {"status": "unchecked", "error": "Not a file path"}
+        if WINDOWS_PATH_PATTERN.match(file_path) and os.name != "nt":
+            return {"status": "unchecked", "error": "Windows path is not reachable from this server"}
+        try:
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(self.stat_pool, stat_path, file_path),
+                HEALTH_CHECK_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            return {"status": "broken", "error": "Timed out"}
+
+    async def check(self, content: dict) -> dict:
+        async with self.limit:
+            health = await self.probe(content.get("file_path") or content.get("content_data") or "")
+        previous = content.get("health") or {}
+        now = datetime.utcnow()
+        if health["status"] == "ok":
+            streak = previous.get("healthy_streak", 0) + 1 if previous.get("status") == "ok" else 1
+            delay = min(HEALTH_CHECK_INTERVAL * 2 ** min(streak - 1, 20), HEALTH_CHECK_MAX_INTERVAL)
+        else:
+            streak = 0
+            delay = HEALTH_CHECK_MAX_INTERVAL if health["status"] == "unchecked" else HEALTH_CHECK_INTERVAL
+        health.update({
+            "checked_at": now,
+            "next_check_at": now + timedelta(seconds=delay),
+            "healthy_streak": streak,
+            "changed_at": previous["changed_at"] if previous.get("status") == health["status"] else now,
+        })
+        return health
+
+    async def check_due(self, force: bool = False) -> dict:
+        """Check every item whose next check is due (or all items with ``force``)"""
+        async with self.lock:
+            if self.http is None:
+                self.http = HeadClient()
+                self.stat_pool = ThreadPoolExecutor(max_workers=HEALTH_CHECK_STAT_WORKERS, thread_name_prefix="health-stat")
+            now = datetime.utcnow()
+            if force:
+                await db.content.update_many({}, {"$set": {"health.next_check_at": now}})
+            # Each checked item is rescheduled into the future, so re-running the query pages forward
+            query = {"$or": [{"health.next_check_at": {"$lte": now}}, {"health.next_check_at": None}]}
+            projection = {"_id": 0, "id": 1, "chapter_id": 1, "file_path": 1, "content_data": 1, "health": 1}
+            counts = {}
+            while True:
+                docs = await db.content.find(query, projection).to_list(length=HEALTH_CHECK_BATCH_SIZE)
+                if not docs:
+                    break
+                results = await asyncio.gather(*(self.check(content) for content in docs))
+                await db.content.bulk_write(
+                    [UpdateOne({"id": content["id"]}, {"$set": {"health": health}}) for content, health in zip(docs, results)],
+                    ordered=False,
+                )
+                for health in results:
+                    counts[health["status"]] = counts.get(health["status"], 0) + 1
+                # Reschedules alone don't change what clients act on, so only bump
+                # chapters where an item's status or size moved
+                chapter_ids = {
+                    content["chapter_id"]
+                    for content, health in zip(docs, results)
+                    if content.get("chapter_id") and any(
+                        (content.get("health") or {}).get(field) != health.get(field) for field in ("status", "size")
+                    )
+                }
+                if chapter_ids:
+                    await bump_versions(*(version_scope("content", chapter_id) for chapter_id in chapter_ids))
+                if len(docs) < HEALTH_CHECK_BATCH_SIZE:
+                    break
+            return {"checked": sum(counts.values()), "by_status": counts}
+
+    def close(self):
+        if self.http:
+            self.http.close()
+        if self.stat_pool:
+            self.stat_pool.shutdown(wait=False, cancel_futures=True)
+
+health_checker = ContentHealthChecker()
+
+@job_type("check_content_health", executor="async", concurrency=1, max_attempts=1)
+async def check_content_health(payload: dict) -> dict:
+    return await health_checker.check_due(force=payload.get("force", False))
+
+async def run_health_checker():
+    while True:
+        try:
+            result = await health_checker.check_due()
+            if result["checked"]:
+                logger.info("Checked %d content items: %s", result["checked"], result["by_status"])
+        except Exception as e:
+            logger.error("Content health check failed: %s", e)
+        await asyncio.sleep(HEALTH_CHECK_POLL_INTERVAL)
+
+health_checker_task = None
+
+@app.on_event("startup")
+async def start_health_checker():
+    global health_checker_task
+    if HEALTH_CHECK_ENABLED:
+        health_checker_task = asyncio.create_task(run_health_checker())
+
+@app.on_event("shutdown")
+async def stop_health_checker():
+    if health_checker_task:
+        health_checker_task.cancel()
+    health_checker.close()
+
+# Admin endpoints
+@app.get("/api/admin/indexes")
+async def get_index_report(user_id: str = Depends(verify_token)):
+    """Compare the declared indexes with the live ones and list any query shape still doing a COLLSCAN"""
+    report = await check_indexes()
+    report["collection_scans"] = await find_collection_scans()
+    return report
+
+@app.post("/api/admin/indexes/migrate")
+async def migrate_indexes(user_id: str = Depends(verify_admin)):
+    """Create missing indexes and rebuild ones whose spec changed"""
+    return await ensure_indexes()
+
+@app.post("/api/admin/rollups/rebuild")
+async def rebuild_progress_rollups(user_id: str = Depends(verify_admin)):
+    return await rebuild_rollups()
+
+@app.post("/api/admin/progress/migrate-compact")
+async def migrate_progress_storage(user_id: str = Depends(verify_admin)):
+    if PROGRESS_STORAGE_COMPACT:
+        raise HTTPException(status_code=409, detail="Compact progress storage is already active")
+    return await migrate_progress_to_compact()
+
+@app.get("/api/admin/storage")
+async def get_storage_report(user_id: str = Depends(verify_token)):
+    return await blob_storage_report()
+
+@app.post("/api/admin/storage/gc")
+async def collect_unreferenced_blobs(user_id: str = Depends(verify_admin)):
+    result = await gc_blobs()
+    result["storage"] = await blob_storage_report()
+    return result
+
+@app.post("/api/admin/images/derivatives")
+async def backfill_image_derivatives(user_id: str = Depends(verify_admin)):
+    """Queue derivative generation for stored images that have none yet"""
+    if Image is None:
+        raise HTTPException(status_code=501, detail="Pillow is not installed")
+    queued = []
+    async for blob in db.blobs.find({"image": {"$exists": False}}, {"path": 1}):
+        if get_file_type(blob["path"]) == "image":
+            queued.append(await job_queue.enqueue("image_derivatives", {"blob_id": blob["_id"], "path": blob["path"]}))
+    return {"queued": len(queued), "job_ids": queued}
+
+@app.post("/api/admin/shares/index")
+async def start_share_index(root: Optional[str] = Query(None), user_id: str = Depends(verify_admin)):
+    """Queue an index_share job for one configured share root, or for all of them"""
+    if not LAN_SHARE_ROOTS:
+        raise HTTPException(status_code=400, detail="No LAN share roots configured (set LAN_SHARE_ROOTS)")
+    roots = LAN_SHARE_ROOTS
+    if root:
+        roots = [share for share in LAN_SHARE_ROOTS if share == Path(root)]
+        if not roots:
+            raise HTTPException(status_code=400, detail="Not a configured share root")
+    job_ids = [await job_queue.enqueue("index_share", {"root": str(share), "user_id": user_id}) for share in roots]
+    return {"job_ids": job_ids}
+
+@app.get("/api/admin/content/broken")
+async def get_broken_content(limit: int = Query(100, ge=1, le=1000), user_id: str = Depends(verify_token)):
+    """Health status counts plus the content items currently failing their check"""
+    counts = {
+        row["_id"]: row["count"]
+        async for row in db.content.aggregate([
+            {"$group": {"_id": {"$ifNull": ["$health.status", "pending"]}, "count": {"$sum": 1}}},
+        ])
+    }
+    broken = await db.content.find(
+        {"health.status": "broken"},
+        {"_id": 0, "id": 1, "title": 1, "chapter_id": 1, "file_path": 1, "health": 1},
+    ).sort("health.changed_at", ASCENDING).to_list(length=limit)
+    return {"counts": counts, "broken": broken}
+
+@app.post("/api/admin/content/health-check")
+async def start_health_check(force: bool = Query(False), user_id: str = Depends(verify_admin)):
+    """Queue a health check of due content now; ``force`` re-checks everything"""
+    return {"job_id": await job_queue.enqueue("check_content_health", {"force": force})}
+
+@app.post("/api/admin/search/rebuild")
+async def rebuild_search(user_id: str = Depends(verify_admin)):
+    return await rebuild_search_index()
+
+@app.get("/api/admin/metrics")
+async def get_metrics(user_id: str = Depends(verify_token)):
+    return {
+        "token_cache": token_cache.stats(),
+        "catalog_cache": catalog_cache.stats(),
+        "progress_buffer": progress_buffer.stats() if progress_buffer else None,
+        "jobs_running": dict(job_queue.running),
+    }
+
+# Registered last so shutdown hooks that still write to Mongo run before the client closes
+@app.on_event("shutdown")
+async def close_mongo_client():
+    client.close()
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    import sys
+    if sys.argv[1:] == ["rebuild-rollups"]:
+        # python server.py rebuild-rollups
+        print(asyncio.run(rebuild_rollups()))
+    elif sys.argv[1:] == ["rebuild-search"]:
+        # python server.py rebuild-search
+        print(asyncio.run(rebuild_search_index()))
+    elif sys.argv[1:] == ["gc-blobs"]:
+        # python server.py gc-blobs
+        print(asyncio.run(gc_blobs()))
+    elif sys.argv[1:] == ["migrate-progress-compact"]:
+        # python server.py migrate-progress-compact (before setting PROGRESS_STORAGE=compact)
+        if PROGRESS_STORAGE_COMPACT:
+            sys.exit("Compact progress storage is already active")
+        print(asyncio.run(migrate_progress_to_compact()))
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark for the E-Learning Platform API
+
+Run it once against the old build and once against the new build and compare
+the requests/second figures printed for each concurrency level:
+
+    python backend_benchmark.py http://localhost:8001
+
+--typeahead also seeds 100k content items (use a scratch database) and checks
+prefix-only /api/search latency against its 50 ms target.
+
+--hashing-in-process needs no server: it compares event-loop latency during a
+login storm with bcrypt run inline (the old login path) and on the hashing pool.
+"""
+import asyncio
+import json
+import os
+import random
+import requests
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+
+class ELearningBenchmark:
+    def __init__(self, base_url="http://localhost:8001"):
+        self.base_url = base_url.rstrip("/")
+        self.token = None
+        self.class_ids = []
+
+    def login(self, email="admin@example.com", password="Admin123!"):
+        """Log in as admin and keep the token for later requests"""
+        response = requests.post(
+            f"{self.base_url}/api/auth/login",
+            json={"email": email, "password": password},
+            timeout=30,
+        )
+        if response.status_code != 200:
+            print(f"❌ Login failed: {response.text}")
+            return False
+        self.token = response.json()["access_token"]
+        return True
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def timed_get(self, session, endpoint):
+        """Issue one GET and return (status_code, latency_seconds)"""
+        start = time.perf_counter()
+        try:
+            response = session.get(f"{self.base_url}/{endpoint}", headers=self.headers(), timeout=60)
+            status = response.status_code
+        except requests.exceptions.RequestException:
+            status = 0
+        return status, time.perf_counter() - start
+
+    def run_load(self, endpoints, concurrency, total_requests):
+        """Fire total_requests GETs spread over endpoints with the given concurrency"""
+        sessions = [requests.Session() for _ in range(concurrency)]
+
+        def worker(i):
+            return self.timed_get(sessions[i % concurrency], endpoints[i % len(endpoints)])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, range(total_requests)))
+        elapsed = time.perf_counter() - start
+
+        for session in sessions:
+            session.close()
+
+        latencies = sorted(latency for _, latency in results)
+        errors = sum(1 for status, _ in results if status != 200)
+        return {
+            "concurrency": concurrency,
+            "requests": total_requests,
+            "errors": errors,
+            "elapsed": elapsed,
+            "rps": total_requests / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+        }
+
+    def read_endpoints(self):
+        """Catalog read endpoints exercised by the throughput benchmark"""
+        endpoints = ["api/classes"]
+        response = requests.get(f"{self.base_url}/api/classes", headers=self.headers(), timeout=30)
+        if response.status_code == 200:
+            self.class_ids = [cls["id"] for cls in response.json()]
+        endpoints.extend(f"api/subjects/{class_id}" for class_id in self.class_ids[:5])
+        return endpoints
+
+    def benchmark_throughput(self, levels=(1, 10, 50, 100, 300), requests_per_level=600):
+        """Measure read throughput as concurrency grows"""
+        print("\n🚀 Concurrent read throughput")
+        endpoints = self.read_endpoints()
+        print(f"   Endpoints: {', '.join(endpoints)}")
+        for concurrency in levels:
+            result = self.run_load(endpoints, concurrency, max(requests_per_level, concurrency))
+            print_result(result)
+
+    def login_storm(self, stop_event, stats):
+        """Hammer the login endpoint until stop_event is set"""
+        session = requests.Session()
+        while not stop_event.is_set():
+            try:
+                response = session.post(
+                    f"{self.base_url}/api/auth/login",
+                    json={"email": "admin@example.com", "password": "Admin123!"},
+                    timeout=60,
+                )
+                stats[response.status_code] = stats.get(response.status_code, 0) + 1
+            except requests.exceptions.RequestException:
+                stats[0] = stats.get(0, 0) + 1
+        session.close()
+
+    def benchmark_login_storm(self, storm_threads=50, concurrency=10, total_requests=500):
+        """Compare /api/classes latency when idle and while logins flood the server"""
+        print("\n🔐 /api/classes latency during a login storm")
+        quiet = self.run_load(["api/classes"], concurrency, total_requests)
+        print("   Quiet server:")
+        print_result(quiet)
+
+        stop_event = threading.Event()
+        stats = {}
+        storm = [
+            threading.Thread(target=self.login_storm, args=(stop_event, stats), daemon=True)
+            for _ in range(storm_threads)
+        ]
+        for thread in storm:
+            thread.start()
+        time.sleep(2)  # let the storm saturate the hashing pool
+        try:
+            stormy = self.run_load(["api/classes"], concurrency, total_requests)
+        finally:
+            stop_event.set()
+            for thread in storm:
+                thread.join()
+
+        print(f"   During storm ({storm_threads} login threads):")
+        print_result(stormy)
+        print(f"   Login responses by status: {dict(sorted(stats.items()))}")
+        if quiet["p99"]:
+            print(f"   p99 ratio storm/quiet: {stormy['p99'] / quiet['p99']:.2f}x")
+
+    def serialization_endpoints(self):
+        """Read endpoints plus the larger payloads worth compressing"""
+        endpoints = self.read_endpoints() + ["api/catalog/tree"]
+        if self.class_ids:
+            endpoints.append(f"api/catalog/tree?class_id={self.class_ids[0]}")
+        return endpoints
+
+    def benchmark_serialization(self, rounds=50):
+        """Per-endpoint JSON encoding cost (old path vs orjson) and compressed size on the wire"""
+        print("\n🧾 Serialization cost per endpoint")
+        print("   old = jsonable_encoder + json.dumps (FastAPI default), new = orjson.dumps")
+        for endpoint in self.serialization_endpoints():
+            plain = requests.get(
+                f"{self.base_url}/{endpoint}",
+                headers={**self.headers(), "Accept-Encoding": "identity"},
+                timeout=60,
+            )
+            if plain.status_code != 200:
+                print(f"   {endpoint}: HTTP {plain.status_code}, skipped")
+                continue
+            payload = revive_datetimes(plain.json())
+
+            old_ms = time_call(lambda: encode_like_fastapi(payload), rounds)
+            new_ms = time_call(lambda: orjson.dumps(payload), rounds) if orjson else None
+
+            compressed = requests.get(
+                f"{self.base_url}/{endpoint}",
+                headers={**self.headers(), "Accept-Encoding": "br, gzip"},
+                timeout=60,
+                stream=True,
+            )
+            encoding = compressed.headers.get("Content-Encoding", "identity")
+            wire_bytes = len(compressed.raw.read())
+            compressed.close()
+
+            if new_ms is None:
+                new_text = "new=n/a (orjson not installed)"
+            else:
+                new_text = f"new={new_ms:7.2f} ms ({old_ms / new_ms if new_ms else 0:4.1f}x)"
+            print(
+                f"   {endpoint:<45} {len(plain.content) / 1024:8.1f} KB  "
+                f"old={old_ms:7.2f} ms  {new_text}  "
+                f"wire={wire_bytes / 1024:7.1f} KB {encoding}"
+            )
+
+    def bulk_create(self, endpoint, items):
+        response = requests.post(
+            f"{self.base_url}/api/{endpoint}/bulk-create",
+            headers=self.headers(),
+            json={"items": items},
+            timeout=600,
+        )
+        response.raise_for_status()
+        return [result["id"] for result in response.json()["results"] if result["status"] == "created"]
+
+    def seed_search_catalog(self, total_items, vocabulary, batch_size=10000):
+        """Create one class, 10 subjects, 100 chapters and total_items content items titled from vocabulary"""
+        rng = random.Random(42)
+        [class_id] = self.bulk_create("classes", [{"name": "Search bench", "description": "", "grade": "bench"}])
+        subject_ids = self.bulk_create(
+            "subjects", [{"name": f"Subject {i}", "description": "", "class_id": class_id} for i in range(10)]
+        )
+        chapter_ids = self.bulk_create(
+            "chapters",
+            [{"name": f"Chapter {i}", "description": "", "subject_id": subject_ids[i % 10]} for i in range(100)],
+        )
+        for start in range(0, total_items, batch_size):
+            items = [
+                {
+                    "title": " ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 6))),
+                    "content_type": "document",
+                    "file_path": f"bench/{start + i}.pdf",
+                    "chapter_id": chapter_ids[(start + i) % len(chapter_ids)],
+                }
+                for i in range(min(batch_size, total_items - start))
+            ]
+            self.bulk_create("content", items)
+
+    def benchmark_typeahead(self, total_items=100000, rounds=200, target_ms=50):
+        """Prefix-only /api/search latency over a catalog of total_items content items"""
+        print(f"\n🔎 Type-ahead latency over {total_items} content items")
+        vocabulary = [
+            "algebra", "anatomy", "biology", "botany", "calculus", "cell", "chemistry", "circuits", "civics",
+            "economics", "energy", "equations", "force", "fractions", "geography", "geometry", "grammar",
+            "history", "light", "magnetism", "maps", "matter", "motion", "numbers", "optics", "physics",
+            "plants", "poetry", "probability", "reading", "sound", "statistics", "trigonometry", "writing",
+        ]
+        start = time.perf_counter()
+        self.seed_search_catalog(total_items, vocabulary)
+        rebuild = requests.post(f"{self.base_url}/api/admin/search/rebuild", headers=self.headers(), timeout=3600)
+        rebuild.raise_for_status()
+        print(f"   Seeded and indexed in {time.perf_counter() - start:.1f} s: {rebuild.json()['indexed']}")
+
+        session = requests.Session()
+        for q in ("a", "ma", "geo", "trig", "physics", "zz"):
+            latencies = []
+            for _ in range(rounds):
+                status, latency = self.timed_get(session, f"api/search?q={q}&prefix=true&limit=20")
+                if status == 200:
+                    latencies.append(latency)
+            latencies.sort()
+            p99 = percentile(latencies, 99) * 1000
+            print(
+                f"   q={q!r:<10} p50={percentile(latencies, 50) * 1000:7.1f} ms  p99={p99:7.1f} ms  "
+                f"{'ok' if latencies and p99 <= target_ms else 'OVER TARGET'} ({target_ms} ms)  "
+                f"errors={rounds - len(latencies)}/{rounds}"
+            )
+        session.close()
+
+
+async def hashing_scenario(server, httpx, password_hash, check, storm_tasks, rate, duration):
+    """GET / latency at a fixed request rate while storm_tasks coroutines verify passwords with check.
+
+    Latency is measured from each request's scheduled start, so time spent
+    waiting for a blocked event loop counts against it.
+    """
+    stop = asyncio.Event()
+    logins = {"ok": 0, "busy": 0}
+
+    async def storm():
+        while not stop.is_set():
+            try:
+                await check("Admin123!", password_hash)
+                logins["ok"] += 1
+            except server.HTTPException:
+                logins["busy"] += 1
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        storms = [asyncio.create_task(storm()) for _ in range(storm_tasks)]
+        await asyncio.sleep(2 if storm_tasks else 0)
+        logins_before = logins["ok"]
+        latencies = []
+        errors = 0
+
+        async def probe(scheduled):
+            nonlocal errors
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            response = await client.get("/")
+            latencies.append(time.perf_counter() - scheduled)
+            errors += response.status_code != 200
+
+        start = time.perf_counter()
+        total = int(rate * duration)
+        await asyncio.gather(*(probe(start + i / rate) for i in range(total)))
+        elapsed = time.perf_counter() - start
+        logins_done = logins["ok"] - logins_before
+        stop.set()
+        await asyncio.gather(*storms)
+
+    latencies.sort()
+    return {
+        "concurrency": f"{rate}/s",
+        "requests": total,
+        "errors": errors,
+        "elapsed": elapsed,
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "logins_per_s": logins_done / elapsed if elapsed else 0.0,
+        "busy": logins["busy"],
+    }
+
+
+def benchmark_hashing_in_process(storm_tasks=30, rate=50, duration=20):
+    """Event-loop latency during a login storm, bcrypt inline on the loop (old) vs on the hashing pool (new).
+
+    Runs the app in-process through httpx's ASGI transport and probes GET /,
+    which does no database work, so it needs neither a server nor MongoDB and
+    isolates what moving bcrypt off the loop changes. The storm verifies
+    passwords the way the login route does, minus the user lookup.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    import bcrypt
+    import httpx
+    import server
+
+    async def inline_check(password, password_hash):
+        # What login did before the hashing pool: bcrypt straight on the event loop
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+    password_hash = server._hash_password("Admin123!")
+    print(f"\n🔐 In-process GET / latency during a login storm ({storm_tasks} concurrent logins, {os.cpu_count()} CPUs)")
+    print(f"   Hashing pool: {server.PASSWORD_HASH_WORKERS} workers, queue {server.PASSWORD_HASH_MAX_QUEUE}")
+    for label, check, tasks in (
+        ("Quiet", None, 0),
+        ("Storm, bcrypt inline (old)", inline_check, storm_tasks),
+        ("Storm, hashing pool (new)", server.check_password, storm_tasks),
+    ):
+        result = asyncio.run(hashing_scenario(server, httpx, password_hash, check, tasks, rate, duration))
+        print(f"   {label}:")
+        print_result(result)
+        if tasks:
+            print(f"      logins/s={result['logins_per_s']:.1f}  busy (503)={result['busy']}")
+
+
+def revive_datetimes(value):
+    """Turn ISO timestamps in *_at fields back into datetimes, as the server holds them"""
+    if isinstance(value, list):
+        return [revive_datetimes(item) for item in value]
+    if isinstance(value, dict):
+        revived = {}
+        for key, item in value.items():
+            if key.endswith("_at") and isinstance(item, str):
+                try:
+                    item = datetime.fromisoformat(item)
+                except ValueError:
+                    pass
+            revived[key] = revive_datetimes(item)
+        return revived
+    return value
+
+
+def encode_like_fastapi(payload):
+    if jsonable_encoder is not None:
+        payload = jsonable_encoder(payload)
+        return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return json.dumps(payload, default=lambda value: value.isoformat(), separators=(",", ":")).encode("utf-8")
+
+
+def time_call(func, rounds):
+    """Average milliseconds per call over rounds"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def print_result(result):
+    print(
+        f"   c={result['concurrency']:<4} "
+        f"{result['rps']:8.1f} req/s  "
+        f"p50={result['p50'] * 1000:7.1f} ms  "
+        f"p99={result['p99'] * 1000:7.1f} ms  "
+        f"errors={result['errors']}/{result['requests']}"
+    )
+
+
+def main():
+    if "--hashing-in-process" in sys.argv:
+        benchmark_hashing_in_process()
+        return 0
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    base_url = args[0] if args else "http://localhost:8001"
+    print(f"📈 Benchmarking {base_url}")
+    print("=" * 50)
+
+    bench = ELearningBenchmark(base_url)
+    if not bench.login():
+        return 1
+
+    bench.benchmark_throughput()
+    bench.benchmark_login_storm()
+    bench.benchmark_serialization()
+    if "--typeahead" in sys.argv:
+        bench.benchmark_typeahead()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
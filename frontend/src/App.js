@@ -134,23 +134,13 @@ function App() {
   const fetchChapterDetails = async (chapterId) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API_BASE_URL}/api/chapter/${chapterId}`, {
+      // One request returns chapter, subject, class, content and our progress
+      const response = await fetch(`${API_BASE_URL}/api/chapter/${chapterId}/view`, {
         headers: { 'Authorization': `Bearer ${token}` },
       });
       
       if (response.ok) {
         const data = await response.json();
-        
-        // Fetch content for this chapter
-        const contentResponse = await fetch(`${API_BASE_URL}/api/content/${chapterId}`, {
-          headers: { 'Authorization': `Bearer ${token}` },
-        });
-        
-        if (contentResponse.ok) {
-          const contentData = await contentResponse.json();
-          data.content = contentData;
-        }
-        
         setChapterDetails(data);
       }
     } catch (err) {
@@ -202,21 +192,22 @@ function App() {
   const markChapterComplete = async (chapterId) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await fetch(`${API_BASE_URL}/api/progress/update`, {
+      // The batch endpoint returns the updated progress, so no follow-up fetch is needed
+      const response = await fetch(`${API_BASE_URL}/api/progress/batch`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Authorization': `Bearer ${token}`
         },
         body: JSON.stringify({
-          chapter_id: chapterId,
-          completed: true
+          updates: [{ chapter_id: chapterId, completed: true }]
         }),
       });
 
       if (response.ok) {
+        const data = await response.json();
+        setUserProgress(data.progress);
         alert('Chapter marked as complete!');
-        fetchUserProgress(user.id);
       } else {
         const errorData = await response.json();
         alert(errorData.detail || 'Failed to update progress');
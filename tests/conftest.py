@@ -0,0 +1,75 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# server.py is run from backend/ as a top-level module, so import it the same way
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """The app against a throwaway database on MONGO_URL; tests using it skip without a reachable mongod"""
+    server = pytest.importorskip("server")
+    from fastapi.testclient import TestClient
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pymongo import MongoClient
+    from pymongo.errors import PyMongoError
+
+    mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    admin = MongoClient(mongo_url, serverSelectionTimeoutMS=1000)
+    try:
+        admin.admin.command("ping")
+    except PyMongoError:
+        admin.close()
+        pytest.skip(f"MongoDB is not reachable at {mongo_url}")
+
+    db_name = f"test_{uuid.uuid4().hex[:12]}"
+    client = AsyncIOMotorClient(mongo_url)
+    server.client, server.db = client, client[db_name]
+    # Uploads go to ./uploads, so keep them out of the checkout
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("server"))
+    for folder in ("videos", "images", "documents"):
+        os.makedirs(f"uploads/{folder}")
+    try:
+        with TestClient(server.app) as test_client:
+            test_client.db = admin[db_name]
+            yield test_client
+    finally:
+        os.chdir(cwd)
+        admin.drop_database(db_name)
+        admin.close()
+
+
+def signup(api, role: str = None) -> tuple:
+    """Create a user and return (user_id, Authorization header); roles signup refuses are granted directly"""
+    response = api.post("/api/auth/signup", json={"email": f"{uuid.uuid4().hex}@example.com", "password": "secret"})
+    assert response.status_code == 200
+    user_id = response.json()["user"]["id"]
+    if role:
+        api.db.users.update_one({"id": user_id}, {"$set": {"role": role}})
+    return user_id, {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def user(api):
+    return signup(api)
+
+
+@pytest.fixture
+def auth(user):
+    return user[1]
+
+
+@pytest.fixture
+def other_auth(api):
+    """A second user's Authorization header"""
+    return signup(api)[1]
+
+
+@pytest.fixture
+def admin_auth(api):
+    return signup(api, "admin")[1]
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+class RecordingCollection:
+    """Stands in for a Motor collection; documents at ``rejected`` positions fail like duplicate keys"""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.calls = []
+
+    async def insert_many(self, docs, ordered):
+        self.calls.append((list(docs), ordered))
+        errors = [
+            {"index": i, "code": 11000, "errmsg": "E11000 duplicate key"}
+            for i in range(len(docs)) if i in self.rejected
+        ]
+        if ordered:
+            errors = errors[:1]
+        if errors:
+            raise server.BulkWriteError({"writeErrors": errors})
+
+
+@pytest.fixture
+def bumped(monkeypatch):
+    scopes = []
+
+    async def bump_versions(*args):
+        scopes.extend(args)
+
+    monkeypatch.setattr(server, "bump_versions", bump_versions)
+    return scopes
+
+
+def create(collection, items, ordered=False):
+    bulk = server.BulkCreate(items=items, ordered=ordered)
+    return asyncio.run(server.bulk_create(
+        collection, bulk, server.SubjectCreate, server.new_subject_doc,
+        lambda doc: server.version_scope("subjects", doc["class_id"]), "u1",
+    ))
+
+
+def subject(class_id="c1", **overrides):
+    return {"name": "Physics", "description": "", "class_id": class_id, **overrides}
+
+
+def test_unordered_inserts_every_valid_item(bumped):
+    collection = RecordingCollection()
+    report = create(collection, [subject("c1"), {"name": "no class"}, subject("c2")])
+
+    assert (report["inserted"], report["failed"], report["skipped"]) == (2, 1, 0)
+    assert [result["status"] for result in report["results"]] == ["created", "error", "created"]
+    assert report["results"][1]["error"][0]["loc"] == ["description"]
+    [(docs, ordered)] = collection.calls
+    assert [doc["class_id"] for doc in docs] == ["c1", "c2"]
+    assert not ordered
+    assert sorted(bumped) == ["subjects:c1", "subjects:c2"]
+
+
+def test_ordered_stops_at_the_first_invalid_item(bumped):
+    collection = RecordingCollection()
+    report = create(collection, [subject("c1"), {"name": "no class"}, subject("c2")], ordered=True)
+
+    assert [result["status"] for result in report["results"]] == ["created", "error", "skipped"]
+    assert len(collection.calls[0][0]) == 1
+    assert bumped == ["subjects:c1"]
+
+
+def test_rejected_writes_are_reported_per_item(bumped):
+    report = create(RecordingCollection(rejected={1}), [subject("c1"), subject("c2"), subject("c3")])
+
+    assert [result["status"] for result in report["results"]] == ["created", "error", "created"]
+    assert report["results"][1]["error"].startswith("E11000")
+    assert "subjects:c2" not in bumped
+
+
+def test_ordered_write_failure_skips_the_rest(bumped):
+    report = create(RecordingCollection(rejected={1}), [subject("c1"), subject("c2"), subject("c3")], ordered=True)
+
+    assert [result["status"] for result in report["results"]] == ["created", "error", "skipped"]
+    assert report["inserted"] == 1
+
+
+def test_nothing_valid_writes_nothing(bumped):
+    collection = RecordingCollection()
+    report = create(collection, [{"name": "no class"}])
+
+    assert report["failed"] == 1
+    assert collection.calls == []
+    assert bumped == []
+
+
+def test_too_many_items_is_rejected(bumped, monkeypatch):
+    monkeypatch.setattr(server, "MAX_BULK_ITEMS", 2)
+    with pytest.raises(server.HTTPException) as exc_info:
+        create(RecordingCollection(), [subject()] * 3)
+    assert exc_info.value.status_code == 413
+
+
+def test_bulk_created_catalog_is_listed(api, auth):
+    classes = api.post("/api/classes/bulk-create", headers=auth, json={"items": [
+        {"name": "Grade 7", "description": "", "grade": "7"},
+        {"name": "Grade 8", "description": ""},
+    ]}).json()
+    assert [result["status"] for result in classes["results"]] == ["created", "error"]
+    class_id = classes["results"][0]["id"]
+
+    subjects = api.post("/api/subjects/bulk-create", headers=auth, json={"items": [
+        {"name": name, "description": "", "class_id": class_id} for name in ("Maths", "Science")
+    ]}).json()
+    assert subjects["inserted"] == 2
+    listed = api.get(f"/api/subjects/{class_id}", headers=auth).json()
+    assert sorted(item["name"] for item in listed) == ["Maths", "Science"]
+
+    subject_id = subjects["results"][0]["id"]
+    chapter_id = api.post("/api/chapters/bulk-create", headers=auth, json={"items": [
+        {"name": "Fractions", "description": "", "subject_id": subject_id},
+    ]}).json()["results"][0]["id"]
+    content = api.post("/api/content/bulk-create", headers=auth, json={"ordered": True, "items": [
+        {"title": "Notes", "content_type": "auto", "file_path": "notes/fractions.pdf", "chapter_id": chapter_id},
+        {"title": "Empty", "content_type": "auto", "file_path": "", "chapter_id": chapter_id},
+        {"title": "Video", "content_type": "auto", "file_path": "videos/fractions.mp4", "chapter_id": chapter_id},
+    ]}).json()
+    assert [result["status"] for result in content["results"]] == ["created", "error", "skipped"]
+    listed = api.get(f"/api/content/{chapter_id}", headers=auth).json()
+    assert [(item["title"], item["content_type"]) for item in listed] == [("Notes", "pdf")]
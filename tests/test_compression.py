@@ -0,0 +1,105 @@
+import json
+import zlib
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip, deflate", "gzip"),
+    ("GZIP;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+    ("*;q=0", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert server.negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiate_encoding_prefers_brotli(monkeypatch):
+    monkeypatch.setattr(server, "brotli", object())
+    assert server.negotiate_encoding("gzip, br") == "br"
+    assert server.negotiate_encoding("*") == "br"
+    assert server.negotiate_encoding("br;q=0.5, gzip") == "gzip"
+    assert server.negotiate_encoding("br, gzip;q=0") == "br"
+
+
+def test_negotiate_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(server, "brotli", None)
+    assert server.negotiate_encoding("br") is None
+    assert server.negotiate_encoding("br, gzip;q=0.1") == "gzip"
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_streamed_chunks_decode_as_they_arrive(encoding):
+    compressor = server.Compressor(encoding)
+    decoder = zlib.decompressobj(31) if encoding == "gzip" else server.brotli.Decompressor()
+    decode = decoder.decompress if encoding == "gzip" else decoder.process
+    for i, final in ((1, False), (2, False), (3, True)):
+        line = json.dumps({"row": i}).encode("ascii") + b"\n"
+        assert decode(compressor.compress(line, final)) == line
+
+
+ROWS = [{"id": i, "title": f"Chapter {i}"} for i in range(200)]
+
+
+@pytest.fixture
+def client():
+    """A client for a small app behind CompressionMiddleware"""
+    from fastapi.testclient import TestClient
+
+    app = server.FastAPI()
+    app.add_middleware(server.CompressionMiddleware)
+
+    @app.get("/big")
+    async def big():
+        return server.JSONResponse(ROWS, headers={"ETag": '"v1"'})
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        return server.StreamingResponse(
+            (json.dumps(row) + "\n" for row in ROWS), media_type=server.NDJSON_MEDIA_TYPE
+        )
+
+    @app.get("/media")
+    async def media():
+        return server.Response(json.dumps(ROWS), media_type="application/json", headers={"Accept-Ranges": "bytes"})
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_large_json_is_compressed(client, encoding):
+    response = client.get("/big", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["etag"] == f'"v1-{encoding}"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(json.dumps(ROWS))
+    assert response.json() == ROWS
+
+
+def test_identity_client_gets_plain_json(client):
+    response = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_small_and_ranged_responses_pass_through(client):
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/media", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_ndjson_stream_is_compressed(client):
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert [json.loads(line) for line in response.text.splitlines()] == ROWS
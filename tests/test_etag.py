@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def make_request(query: str = "", **headers) -> server.Request:
+    return server.Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/api/classes",
+        "query_string": query.encode("ascii"),
+        "headers": [(name.replace("_", "-").encode("ascii"), value.encode("ascii")) for name, value in headers.items()],
+    })
+
+
+@pytest.fixture
+def version(monkeypatch):
+    """The version get_version reports, as a one-item list so tests can bump it"""
+    current = [3]
+
+    async def get_version(scope):
+        return current[0]
+
+    monkeypatch.setattr(server, "get_version", get_version)
+    return current
+
+
+def check(request: server.Request) -> tuple:
+    response = server.Response()
+    not_modified = asyncio.run(server.check_not_modified("classes", request, response))
+    return not_modified, response
+
+
+def test_response_is_tagged(version):
+    not_modified, response = check(make_request())
+    assert not_modified is None
+    assert response.headers["etag"] == server.make_etag("classes", 3, make_request())
+    assert response.headers["vary"] == "Accept"
+
+
+def test_current_tag_gets_304(version):
+    etag = server.make_etag("classes", 3, make_request())
+    not_modified, response = check(make_request(if_none_match=etag))
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    assert "etag" not in response.headers
+
+
+def test_compressed_tag_and_tag_lists_match(version):
+    etag = server.make_etag("classes", 3, make_request())
+    assert check(make_request(if_none_match=etag[:-1] + '-gzip"'))[0].status_code == 304
+    assert check(make_request(if_none_match=f'"stale", {etag}'))[0].status_code == 304
+    assert check(make_request(if_none_match="*"))[0].status_code == 304
+
+
+def test_bumped_version_invalidates_the_tag(version):
+    etag = server.make_etag("classes", 3, make_request())
+    version[0] = 4
+    not_modified, response = check(make_request(if_none_match=etag))
+    assert not_modified is None
+    assert response.headers["etag"] != etag
+
+
+def test_tag_depends_on_query_and_representation():
+    plain = server.make_etag("classes", 3, make_request())
+    assert server.make_etag("classes", 3, make_request("limit=5")) != plain
+    assert server.make_etag("classes", 3, make_request(accept=server.NDJSON_MEDIA_TYPE)) != plain
+    assert server.make_etag("subjects:c1", 3, make_request()) != plain
+
+
+def test_unknown_version_skips_revalidation(version):
+    version[0] = None
+    not_modified, response = check(make_request(if_none_match="*"))
+    assert not_modified is None
+    assert "etag" not in response.headers
+
+
+def test_list_revalidates_until_a_write(api, auth):
+    first = api.get("/api/classes", headers=auth)
+    etag = first.headers["etag"]
+    assert first.status_code == 200
+
+    repeat = api.get("/api/classes", headers={**auth, "If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.content == b""
+
+    created = api.post("/api/classes/create", headers=auth, json={"name": "Physics", "description": "", "grade": "9"})
+    assert created.status_code == 200
+    after_write = api.get("/api/classes", headers={**auth, "If-None-Match": etag})
+    assert after_write.status_code == 200
+    assert after_write.headers["etag"] != etag
+    assert created.json()["class_id"] in [item["id"] for item in after_write.json()]
+
+
+def test_write_only_invalidates_its_own_scope(api, auth):
+    class_id = api.post("/api/classes/create", headers=auth, json={"name": "Maths", "description": "", "grade": "8"}).json()["class_id"]
+    subjects = api.get(f"/api/subjects/{class_id}", headers=auth)
+    etag = subjects.headers["etag"]
+
+    api.post("/api/classes/create", headers=auth, json={"name": "Art", "description": "", "grade": "8"})
+    assert api.get(f"/api/subjects/{class_id}", headers={**auth, "If-None-Match": etag}).status_code == 304
@@ -0,0 +1,111 @@
+import asyncio
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status: int, headers: dict = None, body: bytes = b""):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if "Content-Length" not in (headers or {}):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "GET":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        if self.path == "/file":
+            self.reply(200, {"Content-Length": "1234"})
+        elif self.path == "/moved":
+            self.reply(301, {"Location": "/file"})
+        elif self.path == "/no-head":
+            self.reply(405)
+        else:
+            self.reply(404)
+
+    def do_GET(self):
+        if self.path == "/no-head" and self.headers.get("Range") == "bytes=0-0":
+            self.reply(206, {"Content-Range": "bytes 0-0/5000", "Connection": "close"}, b"x")
+        else:
+            self.reply(404)
+
+
+@pytest.fixture
+def stub_url():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def probe(file_path: str) -> dict:
+    async def run():
+        checker = server.ContentHealthChecker()
+        checker.http = server.HeadClient(timeout=5)
+        try:
+            return await checker.probe(file_path)
+        finally:
+            checker.http.close()
+
+    return asyncio.run(run())
+
+
+def test_head_reports_size(stub_url):
+    assert probe(f"{stub_url}/file") == {"status": "ok", "http_status": 200, "size": 1234}
+
+
+def test_redirect_is_followed(stub_url):
+    result = probe(f"{stub_url}/moved")
+    assert result["status"] == "ok"
+    assert result["http_status"] == 200
+    assert result["final_url"] == f"{stub_url}/file"
+
+
+def test_falls_back_to_ranged_get_after_405(stub_url):
+    assert probe(f"{stub_url}/no-head") == {"status": "ok", "http_status": 206, "size": 5000}
+
+
+def test_missing_file_is_broken(stub_url):
+    result = probe(f"{stub_url}/gone")
+    assert result["status"] == "broken"
+    assert result["http_status"] == 404
+
+
+def test_connection_refused_is_broken():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    result = probe(f"http://127.0.0.1:{port}/file")
+    assert result["status"] == "broken"
+    assert result["error"].startswith("ConnectionRefusedError")
+
+
+def test_idle_connection_is_reused(stub_url):
+    async def run():
+        client = server.HeadClient(timeout=5)
+        try:
+            await client.head(f"{stub_url}/file")
+            [idle] = client.idle.values()
+            first = list(idle)
+            await client.head(f"{stub_url}/file")
+            return first, idle
+        finally:
+            client.close()
+
+    first, idle = asyncio.run(run())
+    assert len(first) == 1
+    assert idle == first
@@ -0,0 +1,106 @@
+import os
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=900-5000", [(900, 999)]),
+    ("bytes=500-", [(500, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=0-0, 10-19", [(0, 0), (10, 19)]),
+    ("bytes=1000-", []),
+    ("bytes=20-10", []),
+    ("bytes=0-9, 2000-", [(0, 9)]),
+])
+def test_parse_range_header(header, expected):
+    assert server.parse_range_header(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["items=0-9", "bytes=", "bytes=abc", "bytes=a-9", "bytes=0-x"])
+def test_parse_range_header_ignores_malformed(header):
+    assert server.parse_range_header(header, 1000) is None
+
+
+def test_parse_range_header_ignores_too_many_ranges():
+    header = "bytes=" + ", ".join(f"{i}-{i}" for i in range(server.MEDIA_MAX_RANGES + 1))
+    assert server.parse_range_header(header, 1000) is None
+
+
+DATA = os.urandom(1000)
+
+
+@pytest.fixture
+def media(tmp_path):
+    """A client for an app serving one file through media_response"""
+    from fastapi.testclient import TestClient
+
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(DATA)
+    app = server.FastAPI()
+
+    @app.api_route("/clip", methods=["GET", "HEAD"])
+    async def clip(request: server.Request):
+        return server.media_response(request, path, "video/mp4")
+
+    with TestClient(app) as client:
+        yield client
+
+
+def test_full_file(media):
+    response = media.get("/clip")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == "1000"
+
+
+def test_single_range(media):
+    response = media.get("/clip", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers["content-range"] == "bytes 100-199/1000"
+
+
+def test_multiple_ranges(media):
+    response = media.get("/clip", headers={"Range": "bytes=0-9, -10"})
+    assert response.status_code == 206
+    media_type, _, boundary = response.headers["content-type"].partition("; boundary=")
+    assert media_type == "multipart/byteranges"
+    assert int(response.headers["content-length"]) == len(response.content)
+    parts = response.content.split(f"--{boundary}".encode("ascii"))
+    assert parts[1].endswith(b"Content-Range: bytes 0-9/1000\r\n\r\n" + DATA[:10] + b"\r\n")
+    assert parts[2].endswith(b"Content-Range: bytes 990-999/1000\r\n\r\n" + DATA[-10:] + b"\r\n")
+    assert parts[3] == b"--\r\n"
+
+
+def test_unsatisfiable_range(media):
+    response = media.get("/clip", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1000"
+
+
+def test_stale_if_range_sends_the_whole_file(media):
+    response = media.get("/clip", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+    etag = response.headers["etag"]
+    assert media.get("/clip", headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+
+
+def test_revalidation(media):
+    first = media.get("/clip")
+    assert media.get("/clip", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+    assert media.get("/clip", headers={"If-Modified-Since": first.headers["last-modified"]}).status_code == 304
+    assert media.get("/clip", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_head_sends_headers_only(media):
+    response = media.head("/clip", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == "10"
+    assert response.content == b""
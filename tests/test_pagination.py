@@ -0,0 +1,69 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_keyset_filter_single_key():
+    assert server.keyset_filter(("chapter_id",), ["c1"]) == {"chapter_id": {"$gt": "c1"}}
+
+
+def test_keyset_filter_breaks_ties_on_later_keys():
+    created_at = datetime(2024, 1, 2, 3, 4, 5)
+    assert server.keyset_filter(("created_at", "id"), [created_at, "abc"]) == {"$or": [
+        {"created_at": {"$gt": created_at}},
+        {"created_at": created_at, "id": {"$gt": "abc"}},
+    ]}
+
+
+def test_keyset_filter_after_missing_value():
+    assert server.keyset_filter(("created_at", "id"), [None, "abc"]) == {"$or": [
+        {"created_at": {"$ne": None}},
+        {"created_at": None, "id": {"$gt": "abc"}},
+    ]}
+
+
+def test_cursor_round_trip():
+    doc = {"created_at": datetime(2024, 1, 2, 3, 4, 5, 678000), "id": "abc"}
+    cursor = server.encode_cursor(doc, server.CATALOG_SORT_KEYS)
+    assert server.decode_cursor(cursor, server.CATALOG_SORT_KEYS) == [doc["created_at"], "abc"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    server.encode_cursor({"chapter_id": "c1"}, ("chapter_id",)),
+    base64.urlsafe_b64encode(b"{not json").decode("ascii"),
+    base64.urlsafe_b64encode(b'[{"$date": "yesterday"}, "a"]').decode("ascii"),
+])
+def test_decode_cursor_rejects_bad_cursors(cursor):
+    with pytest.raises(server.HTTPException) as exc_info:
+        server.decode_cursor(cursor, server.CATALOG_SORT_KEYS)
+    assert exc_info.value.status_code == 400
+
+
+def test_projection_keeps_sort_keys_and_drops_hidden_fields():
+    projection = server.build_projection("title, counted", ("chapter_id",), ("counted",))
+    assert projection == {"_id": 0, "title": 1, "chapter_id": 1}
+    assert server.build_projection(None, ("chapter_id",), ("counted",)) == {"_id": 0, "counted": 0}
+
+
+def test_projection_rejects_bad_field_names():
+    with pytest.raises(server.HTTPException) as exc_info:
+        server.build_projection("title,$where", ("id",))
+    assert exc_info.value.status_code == 400
+
+
+def test_list_query_pages_after_the_cursor():
+    cursor = server.encode_cursor({"chapter_id": "c1"}, ("chapter_id",))
+    params = server.ListParams(limit=5, cursor=cursor, fields=None)
+    query, _, sort, limit = server.list_query({"user_id": "u1"}, params, ("chapter_id",))
+    assert query == {"$and": [{"user_id": "u1"}, {"chapter_id": {"$gt": "c1"}}]}
+    assert sort == [("chapter_id", server.ASCENDING)]
+    assert limit == 5
+
+
+def test_unpaginated_list_query_is_unsorted():
+    params = server.ListParams(limit=None, cursor=None, fields=None)
+    assert server.list_query({"a": 1}, params, ("id",))[2:] == (None, None)
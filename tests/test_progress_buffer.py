@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+server = pytest.importorskip("server")
+
+T1 = datetime(2024, 5, 1, 10, 0, 0)
+T2 = datetime(2024, 5, 1, 10, 0, 5)
+
+
+@pytest.fixture
+def buffer(tmp_path):
+    return server.ProgressWriteBuffer(str(tmp_path / "journal.jsonl"), flush_interval=60, max_pending=1000)
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """Record what flush() hands to write_progress instead of writing to Mongo"""
+    batches = []
+
+    async def write_progress(entries):
+        batches.append(dict(entries))
+
+    monkeypatch.setattr(server, "write_progress", write_progress)
+    return batches
+
+
+def test_updates_coalesce_to_the_last_value(buffer, writes):
+    async def run():
+        await buffer.add("u1", {"c1": True, "c2": False}, T1)
+        await buffer.add("u1", {"c1": False}, T2)
+        await buffer.flush()
+
+    asyncio.run(run())
+    assert writes == [{("u1", "c1"): (False, T2), ("u1", "c2"): (False, T1)}]
+    assert buffer.coalesced == 1
+    assert buffer.stats()["pending"] == 0
+
+
+def test_pending_entries_overlay_stored_documents(buffer, writes):
+    asyncio.run(buffer.add("u1", {"c1": True}, T2))
+    stored = [
+        {"user_id": "u1", "chapter_id": "c1", "completed": False, "updated_at": T1},
+        {"user_id": "u1", "chapter_id": "c2", "completed": True, "updated_at": T1},
+    ]
+    merged = sorted(buffer.merge("u1", stored), key=lambda doc: doc["chapter_id"])
+    assert [(doc["chapter_id"], doc["completed"]) for doc in merged] == [("c1", True), ("c2", True)]
+    assert buffer.has_pending("u1")
+    assert not buffer.has_pending("u2")
+
+
+def test_journal_is_replayed_after_a_crash(buffer, writes, tmp_path):
+    asyncio.run(buffer.add("u1", {"c1": True, "c2": False}, T1))
+
+    restarted = server.ProgressWriteBuffer(str(tmp_path / "journal.jsonl"), flush_interval=60, max_pending=1000)
+    assert restarted.replay() == 2
+    assert restarted.pending == {("u1", "c1"): (True, T1), ("u1", "c2"): (False, T1)}
+
+
+def test_successful_flush_compacts_the_journal(buffer, writes, tmp_path):
+    async def run():
+        await buffer.add("u1", {"c1": True}, T1)
+        await buffer.flush()
+
+    asyncio.run(run())
+    assert (tmp_path / "journal.jsonl").read_text() == ""
+
+
+def test_in_flight_entries_stay_visible_until_written(buffer, monkeypatch):
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def write_progress(entries):
+            started.set()
+            await release.wait()
+
+        monkeypatch.setattr(server, "write_progress", write_progress)
+        await buffer.add("u1", {"c1": True}, T1)
+        flush = asyncio.create_task(buffer.flush())
+        await started.wait()
+        seen = (buffer.has_pending("u1"), buffer.merge("u1", []), buffer.stats()["inflight"])
+        release.set()
+        await flush
+        return seen
+
+    has_pending, merged, inflight = asyncio.run(run())
+    assert has_pending
+    assert [(doc["chapter_id"], doc["completed"]) for doc in merged] == [("c1", True)]
+    assert inflight == 1
+    assert buffer.inflight == {}
+
+
+@pytest.mark.parametrize("error", [server.PyMongoError("down"), RuntimeError("bug")])
+def test_failed_flush_keeps_the_batch_and_newer_updates(buffer, monkeypatch, tmp_path, error):
+    async def run():
+        async def write_progress(entries):
+            await buffer.add("u1", {"c1": False}, T2)  # arrives while the flush is writing
+            raise error
+
+        monkeypatch.setattr(server, "write_progress", write_progress)
+        await buffer.add("u1", {"c1": True, "c2": True}, T1)
+        await buffer.flush()
+
+    asyncio.run(run())
+    assert buffer.pending == {("u1", "c1"): (False, T2), ("u1", "c2"): (True, T1)}
+    assert buffer.inflight == {}
+    assert buffer.failed_flushes == 1
+
+    restarted = server.ProgressWriteBuffer(str(tmp_path / "journal.jsonl"), flush_interval=60, max_pending=1000)
+    restarted.replay()
+    assert restarted.pending == buffer.pending
+
+
+def test_cancelled_flush_keeps_the_batch(buffer, monkeypatch):
+    async def run():
+        started = asyncio.Event()
+
+        async def write_progress(entries):
+            started.set()
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(server, "write_progress", write_progress)
+        await buffer.add("u1", {"c1": True}, T1)
+        flush = asyncio.create_task(buffer.flush())
+        await started.wait()
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+
+    asyncio.run(run())
+    assert buffer.pending == {("u1", "c1"): (True, T1)}
+    assert buffer.inflight == {}
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+class RecordingCollection:
+    def __init__(self):
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered):
+        self.operations.extend(operations)
+
+
+def test_deltas_are_summed_per_subject_and_class(monkeypatch):
+    rollups = RecordingCollection()
+    monkeypatch.setattr(server, "db", SimpleNamespace(progress_rollups=rollups))
+
+    async def chapter_scopes(chapter_ids):
+        return {"c1": ("s1", "k1"), "c2": ("s1", "k1"), "c3": ("s2", "k1")}
+
+    monkeypatch.setattr(server, "chapter_scopes", chapter_scopes)
+    asyncio.run(server.apply_rollup_deltas({
+        ("u1", "c1"): 1, ("u1", "c2"): 1, ("u1", "c3"): -1, ("u1", "deleted"): 1, ("u2", "c3"): 1,
+    }))
+
+    increments = {
+        (op._filter["user_id"], op._filter["scope_type"], op._filter["scope_id"]): op._doc["$inc"]["completed"]
+        for op in rollups.operations
+    }
+    # u1's class changes cancel out to +1; nothing is written for a net zero
+    assert increments == {
+        ("u1", "subject", "s1"): 2, ("u1", "subject", "s2"): -1, ("u1", "class", "k1"): 1,
+        ("u2", "subject", "s2"): 1, ("u2", "class", "k1"): 1,
+    }
+
+
+@pytest.fixture(params=["documents", "compact"])
+def storage(request, monkeypatch, api):
+    monkeypatch.setattr(server, "PROGRESS_STORAGE_COMPACT", request.param == "compact")
+    return request.param
+
+
+@pytest.fixture
+def catalog(api, auth):
+    """One class with one two-chapter subject; returns (class_id, subject_id, [chapter_ids])"""
+    class_id = api.post("/api/classes/create", headers=auth, json={"name": "Grade 6", "description": "", "grade": "6"}).json()["class_id"]
+    subject_id = api.post("/api/subjects/create", headers=auth, json={"name": "History", "description": "", "class_id": class_id}).json()["subject_id"]
+    chapters = [
+        api.post("/api/chapters/create", headers=auth, json={"name": name, "description": "", "subject_id": subject_id}).json()["chapter_id"]
+        for name in ("Rome", "Greece")
+    ]
+    return class_id, subject_id, chapters
+
+
+def completion(api, user, class_id) -> tuple:
+    user_id, headers = user
+    rollup = api.get(f"/api/progress/{user_id}/rollup", params={"class_id": class_id}, headers=headers).json()
+    [subject] = rollup["subjects"]
+    [klass] = rollup["classes"]
+    assert (subject["completed"], subject["total"]) == (klass["completed"], klass["total"])
+    return subject["completed"], subject["total"]
+
+
+def test_rollups_follow_progress_writes(api, user, catalog, storage):
+    class_id, _, (rome, greece) = catalog
+    headers = user[1]
+    assert completion(api, user, class_id) == (0, 2)
+
+    api.post("/api/progress/update", headers=headers, json={"chapter_id": rome, "completed": True})
+    assert completion(api, user, class_id) == (1, 2)
+
+    # Rewriting the same state changes nothing
+    api.post("/api/progress/update", headers=headers, json={"chapter_id": rome, "completed": True})
+    assert completion(api, user, class_id) == (1, 2)
+
+    api.post("/api/progress/batch", headers=headers, json={"updates": [
+        {"chapter_id": rome, "completed": False},
+        {"chapter_id": greece, "completed": True},
+        {"chapter_id": rome, "completed": True},
+    ]})
+    assert completion(api, user, class_id) == (2, 2)
+
+    api.post("/api/progress/update", headers=headers, json={"chapter_id": greece, "completed": False})
+    assert completion(api, user, class_id) == (1, 2)
+
+
+def test_uncounted_write_is_counted_once_by_the_next_write(api, user, catalog):
+    class_id, _, (rome, _) = catalog
+    user_id, headers = user
+    # A write that landed but whose reconcile never ran
+    api.db.progress.insert_one({"user_id": user_id, "chapter_id": rome, "completed": True, "counted": False})
+    assert completion(api, user, class_id) == (0, 2)
+
+    for _ in range(2):
+        api.post("/api/progress/update", headers=headers, json={"chapter_id": rome, "completed": True})
+        assert completion(api, user, class_id) == (1, 2)
+
+
+def test_concurrent_reconciles_count_a_change_once(api, user, catalog):
+    class_id, _, (rome, greece) = catalog
+    user_id = user[0]
+    entries = {(user_id, chapter_id): (True, server.datetime.utcnow()) for chapter_id in (rome, greece)}
+
+    async def run():
+        await server.store_progress(entries)
+        await asyncio.gather(*(server.reconcile_rollups(entries) for _ in range(5)))
+
+    api.portal.call(run)
+    assert completion(api, user, class_id) == (2, 2)
+
+
+def test_progress_reads_hide_rollup_bookkeeping(api, user, catalog):
+    _, _, (rome, _) = catalog
+    user_id, headers = user
+    api.post("/api/progress/update", headers=headers, json={"chapter_id": rome, "completed": True})
+    [progress] = api.get(f"/api/progress/{user_id}", headers=headers).json()
+    assert "counted" not in progress
+    assert "counted" not in api.get(f"/api/progress/{user_id}", params={"fields": "completed,counted"}, headers=headers).json()[0]
+
+
+def test_rebuild_matches_incremental_rollups(api, user, catalog, admin_auth):
+    class_id, _, (rome, _) = catalog
+    api.post("/api/progress/update", headers=user[1], json={"chapter_id": rome, "completed": True})
+    before = completion(api, user, class_id)
+
+    assert api.post("/api/admin/rollups/rebuild", headers=user[1]).status_code == 403
+    assert api.post("/api/admin/rollups/rebuild", headers=admin_auth).status_code == 200
+    assert completion(api, user, class_id) == before == (1, 2)
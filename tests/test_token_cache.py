@@ -0,0 +1,31 @@
+import pytest
+
+server = pytest.importorskip("server")
+
+
+def test_token_cache_drops_entries_at_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(server.time, "time", lambda: now[0])
+    cache = server.VerifiedTokenCache(10)
+    cache.put("token", "user-1", 1060.0)
+
+    now[0] = 1059.9
+    assert cache.get("token") == "user-1"
+    now[0] = 1060.0
+    assert cache.get("token") is None
+    assert "token" not in cache.entries
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_token_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(server.time, "time", lambda: 1000.0)
+    cache = server.VerifiedTokenCache(2)
+    cache.put("a", "user-a", 2000.0)
+    cache.put("b", "user-b", 2000.0)
+    assert cache.get("a") == "user-a"
+    cache.put("c", "user-c", 2000.0)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "user-a"
+    assert cache.get("c") == "user-c"
+    assert cache.stats()["size"] == 2
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+@pytest.mark.parametrize("ranges, expected", [
+    ([], []),
+    ([[0, 10]], [[0, 10]]),
+    ([[10, 20], [0, 10]], [[0, 20]]),
+    ([[0, 10], [5, 8], [15, 30], [20, 40]], [[0, 10], [15, 40]]),
+    ([[40, 50], [0, 10], [11, 20]], [[0, 10], [11, 20], [40, 50]]),
+])
+def test_merge_ranges(ranges, expected):
+    assert server.merge_ranges(ranges) == expected
+
+def test_session_status_reports_the_contiguous_prefix():
+    session = {
+        "_id": "s1", "filename": "talk.mp4", "size": 100, "status": "open", "expires_at": None,
+        "ranges": [[50, 100], [0, 20], [10, 30]],
+    }
+    status = server.session_status(session)
+    assert status["offset"] == 30
+    assert status["received_bytes"] == 80
+    assert status["received_ranges"] == [[0, 30], [50, 100]]
+
+
+def test_session_without_its_first_bytes_resumes_at_zero():
+    session = {"_id": "s1", "filename": "talk.mp4", "size": 100, "status": "open", "expires_at": None, "ranges": [[10, 100]]}
+    assert server.session_status(session)["offset"] == 0
+
+
+@pytest.fixture
+def chapter_id(api, auth):
+    class_id = api.post("/api/classes/create", headers=auth, json={"name": "Grade 10", "description": "", "grade": "10"}).json()["class_id"]
+    subject_id = api.post("/api/subjects/create", headers=auth, json={"name": "Biology", "description": "", "class_id": class_id}).json()["subject_id"]
+    return api.post("/api/chapters/create", headers=auth, json={"name": "Cells", "description": "", "subject_id": subject_id}).json()["chapter_id"]
+
+
+def open_session(api, auth, chapter_id, size) -> str:
+    response = api.post("/api/uploads/sessions", headers=auth, json={
+        "filename": "lecture.mp4", "size": size, "chapter_id": chapter_id, "title": "Lecture",
+    })
+    assert response.status_code == 200
+    return response.json()["session_id"]
+
+
+def test_chunks_in_any_order_assemble_the_file(api, auth, chapter_id):
+    data = os.urandom(3000)
+    session_id = open_session(api, auth, chapter_id, len(data))
+    url = f"/api/uploads/sessions/{session_id}"
+
+    for offset in (2000, 0):
+        assert api.put(url, params={"offset": offset}, content=data[offset:offset + 1000], headers=auth).status_code == 200
+    status = api.get(url, headers=auth).json()
+    assert (status["offset"], status["received_ranges"]) == (1000, [[0, 1000], [2000, 3000]])
+
+    incomplete = api.post(f"{url}/finalize", headers=auth)
+    assert incomplete.status_code == 409
+    assert incomplete.json()["detail"]["received_ranges"] == [[0, 1000], [2000, 3000]]
+
+    api.put(url, params={"offset": 1000}, content=data[1000:2000], headers=auth)
+    finalized = api.post(f"{url}/finalize", headers=auth)
+    assert finalized.status_code == 200
+    result = finalized.json()
+    assert result["file_size"] == len(data)
+    with open(result["file_path"], "rb") as stored:
+        assert stored.read() == data
+
+    [content] = api.get(f"/api/content/{chapter_id}", headers=auth).json()
+    assert (content["id"], content["content_type"], content["sha256"]) == (result["content_id"], "video", result["sha256"])
+    assert api.get(url, headers=auth).status_code == 404
+    assert not server.session_part_path(session_id).exists()
+
+
+def test_retried_chunk_is_recorded_once(api, auth, chapter_id):
+    data = os.urandom(100)
+    session_id = open_session(api, auth, chapter_id, len(data))
+    url = f"/api/uploads/sessions/{session_id}"
+    for _ in range(2):
+        api.put(url, params={"offset": 0}, content=data, headers=auth)
+    assert api.get(url, headers=auth).json()["received_ranges"] == [[0, 100]]
+    assert api.post(f"{url}/finalize", headers=auth).status_code == 200
+
+
+def test_chunks_past_the_declared_size_are_refused(api, auth, chapter_id):
+    session_id = open_session(api, auth, chapter_id, 100)
+    url = f"/api/uploads/sessions/{session_id}"
+    assert api.put(url, params={"offset": 100}, content=b"x", headers=auth).status_code == 416
+    assert api.put(url, params={"offset": 90}, content=b"x" * 20, headers=auth).status_code == 416
+    assert api.get(url, headers=auth).json()["received_ranges"] == []
+
+
+def test_sessions_belong_to_their_creator(api, auth, chapter_id, other_auth):
+    session_id = open_session(api, auth, chapter_id, 100)
+    assert api.get(f"/api/uploads/sessions/{session_id}", headers=other_auth).status_code == 404
+    assert api.put(f"/api/uploads/sessions/{session_id}", params={"offset": 0}, content=b"x", headers=other_auth).status_code == 404
+
+
+def test_expired_sessions_are_swept(api, auth, chapter_id):
+    session_id = open_session(api, auth, chapter_id, 100)
+    api.db.upload_sessions.update_one({"_id": session_id}, {"$set": {"expires_at": server.datetime(2000, 1, 1)}})
+
+    assert api.portal.call(server.sweep_upload_sessions) == 1
+    assert api.get(f"/api/uploads/sessions/{session_id}", headers=auth).status_code == 404
+    assert not server.session_part_path(session_id).exists()